@@ -6,6 +6,7 @@ G.register_custom_device(WindowsPlatform)
 G.LOGGER = ZafkielLogger(None)
 
 from zafkiel.config import Config
+from zafkiel.context import DeviceContext, current_context, current_device
 from zafkiel.device.api import *
 from zafkiel.device.template import ImageTemplate as Template
 from zafkiel.timer import Timer
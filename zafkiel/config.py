@@ -7,3 +7,19 @@ class Config:
     ST.THRESHOLD = 0.8
     KEEP_FOREGROUND = False
     BUFFER_TIME = 3     # seconds, time to wait before bringing window to foreground
+    OCR_MEMORY_BUDGET = None    # MB, unload least recently used OCR models above it, None for no limit
+    OCR_SERVER = None           # address of zafkiel.ocr.server to run OCR in, None to load models in process
+    # Shared secret of OCR server, None to use the random key the server writes to a user-only file on start
+    OCR_SERVER_AUTHKEY = None
+    CAPTURE_BUFFERS = 0         # output arrays reused in turn by capture backends, 0 to allocate every frame
+    # Screen height template matching runs at, 'template' for the resolution of each template, None for full size.
+    # Screen is downscaled once per frame, OCR still runs at full size.
+    MATCH_RESOLUTION = None
+    PAGE_WEIGHT_FILE = None     # json file to persist page transition times learned in UI.ui_goto(), None to disable
+
+    # After touch() and swipe(), wait until screen changed and settled instead of a fixed delay
+    WAIT_SCREEN_CHANGE = False
+    SCREEN_CHANGE_TIMEOUT = 2       # seconds, upper bound of waiting
+    SCREEN_CHANGE_THRESHOLD = 2.    # mean gray level difference of downscaled frames that counts as changed
+    SCREEN_STABLE_TIME = 0.1        # seconds, screen is settled if unchanged for this long
+    SCREEN_CHANGE_INTERVAL = 0.03   # seconds between two captures while waiting for screen change
@@ -0,0 +1,87 @@
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from airtest.core.helper import G
+
+from zafkiel.device.executor import InputExecutor
+
+
+class DeviceContext:
+    """
+    State of one device, so that one process can drive many devices in threads or asyncio tasks,
+    sharing templates, keyword indexes and OCR models.
+
+    `loop_find()`, `touch()`, `swipe()`, `screenshot()`, template areas and `UI.ui_current`
+    resolve against the context entered in the current thread or task.
+    Outside any context, the default context follows the global `G.DEVICE`.
+    The page graph, learned link weights and popup registrations stay shared among devices.
+
+    Examples:
+        def run(dev):
+            with DeviceContext(connect_device(dev)):
+                MyUI().ui_goto(page_main)
+
+        threads = [threading.Thread(target=run, args=(dev,)) for dev in devices]
+    """
+
+    def __init__(self, device=None, name: str = None):
+        """
+        Args:
+            device: Airtest device, None to follow `G.DEVICE`.
+            name: Name shown in logs, defaults to device uuid.
+        """
+        self._device = device
+        self._name = name
+        self._tokens = []
+        self.ui_current: dict = {'page': None, 'expected': None}
+        self.executor = InputExecutor(lambda: self.device)
+
+    @property
+    def device(self):
+        return self._device if self._device is not None else G.DEVICE
+
+    @property
+    def name(self) -> str:
+        if self._name is not None:
+            return self._name
+        return str(getattr(self.device, 'uuid', None))
+
+    def __str__(self):
+        return f'DeviceContext({self.name})'
+
+    __repr__ = __str__
+
+    def __enter__(self) -> 'DeviceContext':
+        self._tokens.append(_context.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _context.reset(self._tokens.pop())
+
+    def run(self, func: Callable, *args, **kwargs):
+        """
+        Call func in this context, e.g. as the target of a new thread, which starts without any context.
+        """
+        with self:
+            return func(*args, **kwargs)
+
+
+DEFAULT_CONTEXT = DeviceContext()
+_context: ContextVar[Optional[DeviceContext]] = ContextVar('zafkiel_device_context', default=None)
+
+
+def current_context() -> DeviceContext:
+    """
+    Returns:
+        Context entered in the current thread or task, or `DEFAULT_CONTEXT`.
+    """
+    context = _context.get()
+    return context if context is not None else DEFAULT_CONTEXT
+
+
+def current_device():
+    """
+    Returns:
+        Device of the current context.
+    """
+    return current_context().device
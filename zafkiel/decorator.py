@@ -1,5 +1,8 @@
+import weakref
 from typing import Callable, Generic, TypeVar
 
+from zafkiel.context import current_device
+
 T = TypeVar("T")
 
 
@@ -54,6 +57,36 @@ class cached_property(Generic[T]):
         return value
 
 
+class device_cached_property(Generic[T]):
+    """
+    A property that is computed once per instance and device of the current context,
+    for values depending on device resolution. Deleting the attribute resets it on all devices.
+    """
+
+    def __init__(self, func: Callable[..., T]):
+        self.func = func
+        self.cache_name = f'_device_cache_{func.__name__}'
+
+    def __get__(self, obj, cls) -> T:
+        if obj is None:
+            return self
+
+        device = current_device()
+        if device is None:
+            return self.func(obj)
+        cache = obj.__dict__.get(self.cache_name)
+        if cache is None:
+            cache = obj.__dict__[self.cache_name] = weakref.WeakKeyDictionary()
+        try:
+            return cache[device]
+        except KeyError:
+            value = cache[device] = self.func(obj)
+            return value
+
+    def __delete__(self, obj):
+        obj.__dict__.pop(self.cache_name, None)
+
+
 def run_until_true(f):
     """
     Run a function until it returns True, no matter how many times it has been called.
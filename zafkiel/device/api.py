@@ -1,5 +1,9 @@
+import concurrent.futures
 import os
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import Optional, Tuple, Type, Callable, Union, List
 import threading
 
@@ -11,58 +15,154 @@ from airtest.core.settings import Settings as ST
 from airtest.utils.compat import script_log_dir
 from pywinauto.findwindows import ElementNotFoundError
 
+from zafkiel.config import Config
+from zafkiel.context import current_context, current_device
 from zafkiel.device.cv import loop_find
+from zafkiel.device.frame import capture
 from zafkiel.device.template import ImageTemplate as Template
 from zafkiel.logger import logger
 from zafkiel.exception import NotRunningError, ScriptError
 from zafkiel.ocr.ocr import Ocr
 from zafkiel.timer import Timer
-from zafkiel.utils import random_rectangle_point
+from zafkiel.utils import random_rectangle_point, downscale_gray, frame_diff, crop
 
 
-def _connect_device_with_timeout(dev: str, timeout: float = 5) -> bool:
+@dataclass
+class ConnectReport:
     """
-    Connect device with timeout to avoid blocking when window is not responding.
-    
+    How connecting a device went in `auto_setup()`.
+    """
+    uri: str
+    connected: bool = False
+    attempts: int = 0
+    elapsed: float = 0.
+    device: object = None
+    error: Optional[BaseException] = None
+
+    def __str__(self):
+        if self.connected:
+            return f"{self.uri}: connected in {self.elapsed:.1f}s after {self.attempts} attempt(s)"
+        return f"{self.uri}: not connected in {self.elapsed:.1f}s after {self.attempts} attempt(s)"
+
+
+def _connect_device_with_backoff(
+        dev: str,
+        deadline: float,
+        cancel: threading.Event,
+        timeout: float = 5,
+        backoff: float = 1,
+        max_backoff: float = 8,
+) -> ConnectReport:
+    """
+    Connect device until success, deadline or cancel.
+
+    Each attempt runs in a daemon thread, because connect_device may block in SendMessage
+    when window is not responding. A hung attempt is waited on rather than piled up with new ones.
+    Failed attempts are retried after exponential backoff with jitter.
+
     Args:
         dev: Device URI string
-        timeout: Timeout in seconds for each connection attempt
-        
+        deadline: time.time() to give up
+        cancel: Set to give up early
+        timeout: Seconds an attempt can take before it is reported as not responding
+        backoff: Seconds to wait after the first failed attempt
+        max_backoff: Upper bound of the wait between attempts
+
     Returns:
-        True if connected successfully, False if timeout or ElementNotFoundError
-        
-    Raises:
-        Other exceptions from connect_device
+        ConnectReport, `error` is set if connect_device raised anything other than ElementNotFoundError.
     """
-    result = {"success": False, "error": None}
-    
+    report = ConnectReport(dev)
+    start_time = time.time()
+    delay = backoff
+    attempt = None
+    result = {}
+
     def worker():
         try:
-            connect_device(dev)
-            result["success"] = True
-        except ElementNotFoundError as e:
+            result["device"] = connect_device(dev)
+        except BaseException as e:
             result["error"] = e
-        except Exception as e:
-            result["error"] = e
-    
-    thread = threading.Thread(target=worker, daemon=True)
-    thread.start()
-    thread.join(timeout)
-    
-    if thread.is_alive():
-        # Thread is still running, connection timed out (likely SendMessage blocking)
-        logger.warning(f"connect_device timed out after {timeout}s, window may not be responding")
-        return False
-    
-    if result["success"]:
-        return True
-    
-    if result["error"]:
-        if isinstance(result["error"], ElementNotFoundError):
-            return False
-        raise result["error"]
-    
-    return False
+
+    while not cancel.is_set() and time.time() < deadline:
+        if attempt is None:
+            result.clear()
+            attempt = threading.Thread(target=worker, name=f"connect-{dev}", daemon=True)
+            attempt.start()
+            attempt_start = time.time()
+            report.attempts += 1
+            warned = False
+
+        attempt.join(min(0.1, max(deadline - time.time(), 0)))
+        if attempt.is_alive():
+            if not warned and time.time() - attempt_start > timeout:
+                # Likely SendMessage blocking, keep waiting on the same attempt
+                logger.warning(f"connect_device({dev}) not responding after {timeout}s")
+                warned = True
+            continue
+        attempt = None
+
+        if "device" in result:
+            report.connected = True
+            report.device = result["device"]
+            break
+        error = result.get("error")
+        if error is not None and not isinstance(error, ElementNotFoundError):
+            report.error = error
+            break
+
+        # Full jitter in the upper half, so devices started together do not retry in lockstep
+        cancel.wait(min(delay * random.uniform(0.5, 1), max(deadline - time.time(), 0)))
+        delay = min(delay * 2, max_backoff)
+
+    report.elapsed = time.time() - start_time
+    return report
+
+
+def connect_devices(devices: List[str], firing_time: float = 30, timeout: float = 5) -> List[ConnectReport]:
+    """
+    Connect devices concurrently.
+    `G.DEVICE_LIST` keeps the order of `devices` and `G.DEVICE` is the last one, as if connected one by one.
+
+    Args:
+        devices: connect_device uri in list.
+        firing_time: Seconds to wait for all devices.
+        timeout: Seconds an attempt can take before it is reported as not responding.
+
+    Returns:
+        ConnectReport of each device, in the order of `devices`.
+
+    Raises:
+        Exception raised by connect_device other than ElementNotFoundError, after cancelling other devices.
+    """
+    deadline = time.time() + firing_time
+    cancel = threading.Event()
+    with ThreadPoolExecutor(max_workers=len(devices), thread_name_prefix="auto_setup") as executor:
+        futures = [executor.submit(_connect_device_with_backoff, dev, deadline, cancel, timeout) for dev in devices]
+        try:
+            pending = futures
+            while pending:
+                # Wake up regularly so KeyboardInterrupt is not held back
+                _, pending = concurrent.futures.wait(pending, timeout=0.5)
+                for future in futures:
+                    if future.done() and future.result().error is not None:
+                        cancel.set()
+        except BaseException:
+            cancel.set()
+            raise
+    reports = [future.result() for future in futures]
+
+    for report in reports:
+        logger.info(str(report))
+    connected = [report.device for report in reports if report.connected]
+    if connected:
+        uuids = {device.uuid for device in connected}
+        G.DEVICE_LIST[:] = [device for device in G.DEVICE_LIST if device.uuid not in uuids] + connected
+        G.DEVICE = connected[-1]
+
+    for report in reports:
+        if report.error is not None:
+            raise report.error
+    return reports
 
 
 def auto_setup(
@@ -72,7 +172,7 @@ def auto_setup(
         logdir: Optional[Union[bool, str]] = None,
         project_root: str = None,
         compress: int = None
-):
+) -> List[ConnectReport]:
     """
     Auto setup running env and try to connect device if no device is connected.
 
@@ -80,10 +180,17 @@ def auto_setup(
         basedir: basedir of script, __file__ is also acceptable.
         devices: connect_device uri in list.
         firing_time: Game starts taking time, this value should be set larger in old machine.
+            Devices are connected concurrently, so it is the time for all of them.
         logdir: log dir for script report, default is None for no log, set to ``True`` for ``<basedir>/log``.
         project_root: Project root dir for `using` api.
         compress: The compression rate of the screenshot image, integer in range [1, 99], default is 10
 
+    Returns:
+        ConnectReport of each device, with how long connecting took.
+
+    Raises:
+        NotRunningError: If any device is not connected in `firing_time`.
+
     Examples:
         auto_setup(__file__)
         auto_setup(__file__, devices=["Android://127.0.0.1:5037/SJE5T17B17"],
@@ -94,17 +201,12 @@ def auto_setup(
             basedir = os.path.dirname(basedir)
         if basedir not in G.BASEDIR:
             G.BASEDIR.append(basedir)
+    reports = []
     if devices:
-        startup_time = Timer(firing_time).start()
-        for dev in devices:
-            connected = False
-            while not startup_time.reached():
-                if _connect_device_with_timeout(dev, timeout=5):
-                    connected = True
-                    break
-                time.sleep(3)
-            if not connected:
-                raise NotRunningError(dev)
+        reports = connect_devices(devices, firing_time=firing_time)
+        for report in reports:
+            if not report.connected:
+                raise NotRunningError(report.uri)
     if logdir:
         logdir = script_log_dir(basedir, logdir)
         set_logdir(logdir)
@@ -112,6 +214,138 @@ def auto_setup(
         ST.PROJECT_ROOT = project_root
     if compress:
         ST.SNAPSHOT_QUALITY = compress
+    return reports
+
+
+def _try_log_screen():
+    """
+    Same as airtest `try_log_screen()`, but the screenshot comes from the device of current context
+    instead of `G.DEVICE`.
+    """
+    if not ST.LOG_DIR or not ST.SAVE_IMAGE:
+        return None
+    return try_log_screen(current_device().snapshot(quality=ST.SNAPSHOT_QUALITY))
+
+
+def _capture_small(area: Optional[tuple] = None):
+    """
+    Args:
+        area: Upper left and lower right corner coordinate to crop, None for full screen.
+
+    Returns:
+        Downscaled grayscale screenshot, or None if screen is None.
+    """
+    screen = capture()
+    if screen is None:
+        return None
+    if area is not None:
+        screen = crop(screen, area)
+    return downscale_gray(screen)
+
+
+def wait_until_stable(
+        region: Optional[Union[Template, Tuple[int, int, int, int]]] = None,
+        threshold: Optional[float] = None,
+        stable_for: float = 0.3,
+        timeout: float = 5,
+        interval: Optional[float] = None,
+) -> bool:
+    """
+    Wait until screen or a region of it stops changing, e.g. a list stops scrolling before OCR.
+    Successive frames are compared downscaled in grayscale.
+
+    Args:
+        region: ``ImageTemplate`` instance to watch its area, or area (x1, y1, x2, y2), None for full screen.
+        threshold: Mean gray level difference between two frames that counts as changed,
+            None to use `Config.SCREEN_CHANGE_THRESHOLD`.
+        stable_for: Seconds the region must stay unchanged.
+        timeout: Seconds to give up.
+        interval: Seconds to sleep between two captures, None to use `Config.SCREEN_CHANGE_INTERVAL`.
+
+    Returns:
+        True if region is stable, False if timeout.
+
+    Examples:
+        swipe((640, 500), vector=(0, -0.3))
+        wait_until_stable(LIST_AREA, stable_for=0.5)
+        ocr.matched_ocr(screenshot(), ItemName)
+    """
+    if threshold is None:
+        threshold = Config.SCREEN_CHANGE_THRESHOLD
+    if interval is None:
+        interval = Config.SCREEN_CHANGE_INTERVAL
+    area = region.area if isinstance(region, Template) else region
+
+    timer = Timer(timeout).start()
+    stable_timer = Timer(stable_for).start()
+    previous = None
+    while not timer.reached():
+        current = _capture_small(area)
+        if current is not None:
+            if previous is None or frame_diff(current, previous) > threshold:
+                previous = current
+                stable_timer.reset()
+            elif stable_timer.reached():
+                return True
+        if interval:
+            time.sleep(interval)
+
+    logger.info(f"Screen not stable in {timeout}s")
+    return False
+
+
+def _wait_screen_change(before, timeout: float = None) -> bool:
+    """
+    Wait until screen differs from `before` and then stays unchanged for `Config.SCREEN_STABLE_TIME`.
+
+    Args:
+        before: Downscaled grayscale screenshot taken before input.
+        timeout: Upper bound in seconds, None to use `Config.SCREEN_CHANGE_TIMEOUT`.
+
+    Returns:
+        True if screen changed and settled, False if timeout.
+    """
+    if timeout is None:
+        timeout = Config.SCREEN_CHANGE_TIMEOUT
+    timer = Timer(timeout).start()
+
+    # Wait for change
+    while True:
+        if timer.reached():
+            return False
+        current = _capture_small()
+        if current is not None and frame_diff(current, before) > Config.SCREEN_CHANGE_THRESHOLD:
+            break
+        time.sleep(Config.SCREEN_CHANGE_INTERVAL)
+
+    # Wait until settled
+    return wait_until_stable(stable_for=Config.SCREEN_STABLE_TIME, timeout=max(timeout - timer.current(), 0))
+
+
+def _before_operation(wait_change: Optional[bool]):
+    """
+    Returns:
+        Reference frame for _after_operation() if waiting for screen change, otherwise None.
+    """
+    if wait_change is None:
+        wait_change = Config.WAIT_SCREEN_CHANGE
+    if not wait_change:
+        return None
+    return _capture_small()
+
+
+def _after_operation(before):
+    """
+    Wait for screen change if `before` is given, otherwise wait a fixed delay as airtest does.
+    """
+    if before is None:
+        delay_after_operation()
+        return
+    start_time = time.time()
+    if _wait_screen_change(before):
+        logger.debug(f"Screen settled in {time.time() - start_time:.2f}s")
+    else:
+        logger.debug("Screen did not settle in time")
 
 
 def app_is_running() -> bool:
@@ -122,7 +356,7 @@ def app_is_running() -> bool:
     Returns:
         Whether app is running
     """
-    return G.DEVICE.app_is_running()
+    return current_device().app_is_running()
 
 
 def stop_app(package=None):
@@ -139,7 +373,7 @@ def stop_app(package=None):
         stop_app("com.netease.cloudmusic")
         stop_app()  # only test on Windows
     """
-    return G.DEVICE.stop_app(package)
+    return current_device().stop_app(package)
 
 
 @logwrap
@@ -150,6 +384,8 @@ def touch(
         blind: bool = False,
         cls: Type[Ocr] = Ocr,
         v_name: str = None,
+        wait_change: Optional[bool] = None,
+        block: bool = True,
         **kwargs
 ) -> Tuple[int, int]:
     """
@@ -162,10 +398,16 @@ def touch(
         blind: Whether to recognize Template, sometimes we only need to click without caring about the image.
         cls: "Ocr" class or its subclass
         v_name: When v is a coordinate, but you want it has a name.
+        wait_change: True to return once screen changed and settled instead of a fixed delay,
+            None to use `Config.WAIT_SCREEN_CHANGE`.
+        block: False to queue the touches on the input thread and return at once,
+            so the next screenshot and matching overlap with them. Screenshots taken meanwhile
+            have `input_in_flight` set. Use `current_context().executor.wait()` to wait for all queued gestures.
         **kwargs: Platform specific `kwargs`, please refer to corresponding docs.
 
     Returns:
-        Final position to be clicked, e.g. (100, 100)
+        Final position to be clicked, e.g. (100, 100),
+        or a ``concurrent.futures.Future`` resolved to it if `block` is False.
 
     Platforms:
         Android, Windows, iOS
@@ -179,6 +421,10 @@ def touch(
             touch((100, 100), duration=2)
         Right click(Windows):
             touch((100, 100), right_click=True)
+        Keep matching while a long press is performed:
+            future = touch((100, 100), duration=2, block=False)
+            pos = exists(Template(r"tpl1606822430589.png"))
+            future.result()
     """
     if isinstance(v, Template):
         if blind:
@@ -190,12 +436,22 @@ def touch(
         w = v.width * v.ratio()  # actual height and width of target in screen
         pos = random_rectangle_point(center_pos, h, w)
     else:
-        try_log_screen()
+        _try_log_screen()
         pos = v
-    for _ in range(times):
-        G.DEVICE.touch(pos, **kwargs)
-        time.sleep(interval)
-    delay_after_operation()
+    context = current_context()
+    if block:
+        # Keep gestures in order
+        context.executor.wait()
+        before = _before_operation(wait_change)
+        for _ in range(times):
+            context.device.touch(pos, **kwargs)
+            time.sleep(interval)
+        _after_operation(before)
+    else:
+        # Reference frame is taken once earlier queued gestures are done
+        future = context.executor.touch(pos, times=times, interval=interval,
+                                        before=lambda: _before_operation(wait_change),
+                                        after=_after_operation, **kwargs)
 
     if isinstance(v, Template):
         logger.info((f"Click{pos} {times} times" if times > 1 else f"Click{pos}") + f" @{v.name}")
@@ -204,7 +460,7 @@ def touch(
     else:
         logger.info(f"Click{pos} {times} times" if times > 1 else f"Click{pos}")
 
-    return pos
+    return pos if block else future
 
 
 @logwrap
@@ -340,6 +596,8 @@ def swipe(
         vector: Optional[Tuple[float, float]] = None,
         blind1: bool = False,
         blind2: bool = False,
+        wait_change: Optional[bool] = None,
+        block: bool = True,
         **kwargs
 ) -> Tuple[Tuple[int, int], Tuple[int, int]]:
     """
@@ -356,13 +614,15 @@ def swipe(
                 screen e.g.(0.5, 0.5)
         blind1: Whether to recognize Template1, same as parameter of touch().
         blind2: Whether to recognize Template2, same as parameter of touch().
+        wait_change: Same as parameter of touch().
+        block: Same as parameter of touch().
         **kwargs: platform specific `kwargs`, please refer to corresponding docs
 
     Raises:
         general exception when not enough parameters to perform swap action have been provided
 
     Returns:
-        Origin position and target position
+        Origin position and target position, or a ``concurrent.futures.Future`` resolved to them if `block` is False.
 
     Platforms:
         Android, Windows, iOS
@@ -382,7 +642,7 @@ def swipe(
         else:
             pos1 = loop_find(v1, timeout=ST.FIND_TIMEOUT)
     else:
-        try_log_screen()
+        _try_log_screen()
         pos1 = v1
 
     if v2:
@@ -395,21 +655,28 @@ def swipe(
             pos2 = v2
     elif vector:
         if vector[0] <= 1 and vector[1] <= 1:
-            w, h = G.DEVICE.get_current_resolution()
+            w, h = current_device().get_current_resolution()
             vector = (int(vector[0] * w), int(vector[1] * h))
         pos2 = (pos1[0] + vector[0], pos1[1] + vector[1])
     else:
         raise ScriptError("no enough params for swipe")
 
-    G.DEVICE.swipe(pos1, pos2, **kwargs)
-    delay_after_operation()
+    context = current_context()
+    if block:
+        context.executor.wait()
+        before = _before_operation(wait_change)
+        context.device.swipe(pos1, pos2, **kwargs)
+        _after_operation(before)
+    else:
+        future = context.executor.swipe(pos1, pos2, before=lambda: _before_operation(wait_change),
+                                        after=_after_operation, **kwargs)
     logger.info(f"Swipe {pos1} -> {pos2}")
-    return pos1, pos2
+    return (pos1, pos2) if block else future
 
 
 def screenshot():
     """
     Returns:
-        Screenshot image
+        Screenshot image as a ``Frame``, `input_in_flight` tells if a queued gesture was being performed.
     """
-    return G.DEVICE.snapshot(filename=None, quality=ST.SNAPSHOT_QUALITY)
+    return capture()
@@ -0,0 +1,170 @@
+import threading
+import weakref
+from typing import Iterable, Optional
+
+import cv2
+import numpy as np
+
+from zafkiel.config import Config
+from zafkiel.exception import ScriptError
+
+
+class CaptureBackend:
+    """
+    Grab BGR frames. Grabbed BGRA pixels are converted once into a contiguous BGR array,
+    either a new one or one of `buffers` arrays preallocated and reused in turn.
+
+    When the captured size changes, e.g. window resized, a new ring is allocated.
+    Frames from the old ring become detached: they stay valid and are never overwritten,
+    and their memory is freed once no reader holds them.
+    """
+
+    def __init__(self, buffers: int = None):
+        """
+        Args:
+            buffers: Number of output arrays reused in turn, a frame is overwritten after `buffers` more grabs.
+                0 to allocate a new array for every frame. None to use `Config.CAPTURE_BUFFERS`.
+        """
+        self.buffers = Config.CAPTURE_BUFFERS if buffers is None else buffers
+        self._ring: list[np.ndarray] = []
+        self._index = 0
+        self._lock = threading.Lock()
+
+    def _output(self, height: int, width: int) -> Optional[np.ndarray]:
+        if not self.buffers:
+            return None
+        with self._lock:
+            if not self._ring or self._ring[0].shape[:2] != (height, width):
+                # Window resized, frames still held by readers keep the old arrays alive
+                self._ring = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(self.buffers)]
+            out = self._ring[self._index % len(self._ring)]
+            self._index += 1
+            return out
+
+    def _convert(self, bgra: np.ndarray) -> np.ndarray:
+        out = self._output(*bgra.shape[:2])
+        if out is None:
+            return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR)
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=out)
+
+    def grab_bgra(self, monitor: dict = None) -> Optional[np.ndarray]:
+        """
+        To be overridden.
+
+        Args:
+            monitor: Region as {"top", "left", "width", "height"}, None for the whole screen.
+
+        Returns:
+            np.ndarray: (height, width, 4) BGRA pixels, may be a view over a buffer of the backend.
+                None if nothing is captured.
+        """
+        return None
+
+    def grab(self, monitor: dict = None) -> Optional[np.ndarray]:
+        """
+        Args:
+            monitor: Same as `grab_bgra()`.
+
+        Returns:
+            np.ndarray: Contiguous (height, width, 3) BGR frame, or None if nothing is captured.
+        """
+        bgra = self.grab_bgra(monitor)
+        if bgra is None:
+            return None
+        return self._convert(bgra)
+
+    def close(self):
+        self._ring = []
+
+
+class _MssHandle:
+    """
+    mss instance of one thread. Only referenced from thread-local storage,
+    so it is closed when the thread exits, or by `close()`.
+    """
+
+    def __init__(self):
+        import mss
+        self.sct = mss.mss()
+        self._finalizer = weakref.finalize(self, self.sct.close)
+
+    def close(self):
+        self._finalizer()
+
+
+class MssCapture(CaptureBackend):
+    """
+    Capture with mss, keeping one mss instance per thread instead of opening one for every frame,
+    since mss handles are bound to the thread that created them.
+    Instances of short-lived threads are released when those threads exit.
+    """
+
+    def __init__(self, buffers: int = None):
+        super().__init__(buffers)
+        self._local = threading.local()
+        # Key: thread ident. Value: _MssHandle, dropped once the thread exits
+        self._handles = weakref.WeakValueDictionary()
+
+    def _sct(self):
+        handle = getattr(self._local, 'handle', None)
+        if handle is None:
+            handle = self._local.handle = _MssHandle()
+            self._handles[threading.get_ident()] = handle
+        return handle.sct
+
+    def grab_bgra(self, monitor: dict = None) -> np.ndarray:
+        sct = self._sct()
+        if monitor is None:
+            monitor = sct.monitors[0]
+        sct_img = sct.grab(monitor)
+        # View over the raw bytes of mss, no copy
+        return np.frombuffer(sct_img.raw, dtype=np.uint8).reshape(sct_img.height, sct_img.width, 4)
+
+    def close(self):
+        super().close()
+        for handle in list(self._handles.values()):
+            handle.close()
+        self._handles = weakref.WeakValueDictionary()
+        self._local = threading.local()
+
+
+class FileCapture(CaptureBackend):
+    """
+    Replay image files as captured frames, going through the same BGRA conversion and buffers as `MssCapture`.
+    Useful to test consumers and memory behavior without a screen.
+    """
+
+    def __init__(self, files: Iterable[str], loop: bool = True, buffers: int = None):
+        """
+        Args:
+            files: Image files, read once.
+            loop: True to restart from the first file when exhausted, otherwise `grab()` raises StopIteration.
+            buffers: Same as `CaptureBackend`.
+        """
+        super().__init__(buffers)
+        self.frames = []
+        for file in files:
+            image = cv2.imread(file, cv2.IMREAD_UNCHANGED)
+            if image is None:
+                raise ScriptError(f'Cannot read frame {file}')
+            if image.ndim == 2:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
+            elif image.shape[2] == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+            self.frames.append(image)
+        if not self.frames:
+            raise ScriptError('No frame to capture')
+        self.loop = loop
+        self.index = 0
+
+    def grab_bgra(self, monitor: dict = None) -> np.ndarray:
+        if self.index >= len(self.frames):
+            if not self.loop:
+                raise StopIteration
+            self.index = 0
+        image = self.frames[self.index]
+        self.index += 1
+        if monitor is not None:
+            image = image[monitor['top']:monitor['top'] + monitor['height'],
+                          monitor['left']:monitor['left'] + monitor['width']]
+        return image
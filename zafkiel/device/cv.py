@@ -1,16 +1,83 @@
 import time
-from typing import Callable, Tuple, Type
+from typing import Callable, List, Optional, Tuple, Type
 
 from airtest.core.cv import try_log_screen
 from airtest.core.error import TargetNotFoundError
-from airtest.core.helper import logwrap, G
+from airtest.core.helper import logwrap
 
 from zafkiel.config import Config
+from zafkiel.context import current_device
+from zafkiel.device.frame import capture
 from zafkiel.logger import logger
 from zafkiel.ocr.ocr import Ocr
 from zafkiel.utils import is_color_similar, crop
 
 
+def score_screen(v, screen, cls: Type[Ocr] = Ocr) -> Tuple[Optional[Tuple[int, int]], float]:
+    """
+    Search for image template in a given screenshot once, with the confidence of the match.
+
+    Args:
+        v: image template to be found in screenshot
+        screen: screenshot
+        cls: "Ocr" class or its subclass
+
+    Returns:
+        Position of the image template and confidence, or (None, 0.) if not found.
+        Confidence of keyword templates is the OCR score.
+    """
+    if v.rgb and not is_color_similar(v.image, crop(screen, v.area)):
+        return None, 0.
+
+    if v.keyword is not None:
+        ocr = cls(v)
+        ocr_result = ocr.ocr_match_keyword(screen, ocr.button.keyword, direct_ocr=not v.local_search, mode=v.ocr_mode)
+        if not ocr_result:
+            return None, 0.
+        if v.local_search:
+            return (int((v.area[0] + v.area[2]) / 2), int((v.area[1] + v.area[3]) / 2)), ocr_result[0].score
+        x1, y1, x2, y2 = ocr_result[0].area[0], ocr_result[0].area[1], ocr_result[0].area[2], ocr_result[0].area[3]
+        return (int((x1 + x2) / 2), int((y1 + y2) / 2)), ocr_result[0].score
+
+    result = v.score_in(screen, v.local_search)
+    if result is None:
+        return None, 0.
+    return result
+
+
+def match_screen(v, screen, cls: Type[Ocr] = Ocr) -> Optional[Tuple[int, int]]:
+    """
+    Search for image template in a given screenshot once.
+
+    Args:
+        v: image template to be found in screenshot
+        screen: screenshot
+        cls: "Ocr" class or its subclass
+
+    Returns:
+        Position of the image template, or None if not found.
+    """
+    return score_screen(v, screen, cls=cls)[0]
+
+
+def match_templates(templates: list, screen, cls: Type[Ocr] = Ocr, pool=None) -> List[Optional[Tuple[int, int]]]:
+    """
+    Search for multiple image templates in one screenshot.
+
+    Args:
+        templates: image templates to be found in screenshot
+        screen: screenshot
+        cls: "Ocr" class or its subclass
+        pool: ``MatchPool`` to match image templates in worker processes, None to match in current process.
+
+    Returns:
+        Position of each image template, None for those not found.
+    """
+    if pool is not None:
+        return pool.match(templates, screen, cls=cls)
+    return [match_screen(v, screen, cls=cls) for v in templates]
+
+
 @logwrap
 def loop_find(
         v,
@@ -41,7 +108,7 @@ def loop_find(
     """
     start_time = time.time()
     while True:
-        screen = G.DEVICE.snapshot(filename=None, quality=Config.ST.SNAPSHOT_QUALITY)
+        screen = capture()
 
         if screen is None:
             logger.warning("Screen is None, may be locked")
@@ -49,35 +116,23 @@ def loop_find(
             if threshold:
                 v.threshold = threshold
 
-            if not v.rgb or is_color_similar(v.image, crop(screen, v.area)):
-                if v.keyword is not None:
-                    ocr = cls(v)
-                    ocr_result = ocr.ocr_match_keyword(screen, ocr.button.keyword, direct_ocr=not v.local_search, mode=v.ocr_mode)
-                    if ocr_result:
-                        if v.local_search:
-                            match_pos = int((v.area[0] + v.area[2]) / 2), int((v.area[1] + v.area[3]) / 2)
-                        else:
-                            x1, y1, x2, y2 = ocr_result[0].area[0], ocr_result[0].area[1], ocr_result[0].area[2], ocr_result[0].area[3]
-                            match_pos = (int((x1 + x2) / 2), int((y1 + y2) / 2))
-                        try_log_screen(screen)
-                        return match_pos
-                else:
-                    match_pos = v.match_in(screen, v.local_search)
-                    if match_pos:
-                        cost_time = time.time() - start_time
-                        logger.debug(f"ImgRec <{v.name}> cost {cost_time:.2f}s: {match_pos}")
-
-                        try_log_screen(screen)
-                        return match_pos
+            match_pos = match_screen(v, screen, cls=cls)
+            if match_pos:
+                if v.keyword is None:
+                    cost_time = time.time() - start_time
+                    logger.debug(f"ImgRec <{v.name}> cost {cost_time:.2f}s: {match_pos}")
+
+                try_log_screen(screen)
+                return match_pos
 
         if interval_func is not None:
             interval_func()
 
         if (time.time() - start_time) > timeout:
-            if Config.KEEP_FOREGROUND and not G.DEVICE.is_foreground():
+            if Config.KEEP_FOREGROUND and not current_device().is_foreground():
                 time.sleep(Config.BUFFER_TIME)
                 logger.info("Window covered by another window, bringing to foreground...")
-                G.DEVICE.set_foreground()
+                current_device().set_foreground()
                 start_time = time.time()
                 continue
 
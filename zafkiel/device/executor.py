@@ -0,0 +1,127 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+from airtest.core.helper import G
+
+
+class InputExecutor:
+    """
+    Run touch and swipe gestures in order on a dedicated thread,
+    so capture and matching can go on while a gesture is still being performed.
+
+    Examples:
+        future = current_context().executor.touch((100, 100), times=5, interval=0.1)
+        screen = screenshot()   # screen.input_in_flight is True
+        future.result()
+    """
+
+    def __init__(self, get_device: Callable = None):
+        """
+        Args:
+            get_device: Returns the device to perform gestures on, None to use `G.DEVICE`.
+        """
+        self.get_device = get_device
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def device(self):
+        return self.get_device() if self.get_device is not None else G.DEVICE
+
+    @property
+    def in_flight(self) -> bool:
+        """
+        If any queued gesture is not finished yet.
+        """
+        return self._pending > 0
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """
+        Queue a callable after all queued gestures.
+        It runs in a copy of the caller's contextvars, so it resolves against the caller's `DeviceContext`.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='zafkiel-input')
+            self._pending += 1
+
+        def run():
+            try:
+                return func(*args, **kwargs)
+            finally:
+                # Before the future resolves, so waiters never see a stale in_flight
+                with self._lock:
+                    self._pending -= 1
+
+        return self._executor.submit(contextvars.copy_context().run, run)
+
+    def touch(self, pos: Tuple[int, int], times: int = 1, interval: float = 0.05,
+              before: Callable = None, after: Callable = None, **kwargs) -> Future:
+        """
+        Args:
+            pos: Absolute coordinate (x, y).
+            times: How many touches to be performed.
+            interval: Time interval between two touches.
+            before: Called in the input thread right before touches, e.g. to take a reference frame.
+            after: Called in the input thread after touches with the result of `before`,
+                e.g. to wait for screen change.
+            **kwargs: Platform specific `kwargs` of `touch()`.
+
+        Returns:
+            Future resolved to `pos` once the gesture is finished.
+        """
+        device = self.device
+
+        def run():
+            reference = before() if before is not None else None
+            for _ in range(times):
+                device.touch(pos, **kwargs)
+                time.sleep(interval)
+            if after is not None:
+                after(reference)
+            return pos
+
+        return self.submit(run)
+
+    def swipe(self, p1: Tuple[int, int], p2: Tuple[int, int], before: Callable = None, after: Callable = None,
+              **kwargs) -> Future:
+        """
+        Args:
+            p1: Start point.
+            p2: End point.
+            before: Called in the input thread right before swipe, e.g. to take a reference frame.
+            after: Called in the input thread after swipe with the result of `before`,
+                e.g. to wait for screen change.
+            **kwargs: Platform specific `kwargs` of `swipe()`.
+
+        Returns:
+            Future resolved to (p1, p2) once the gesture is finished.
+        """
+        device = self.device
+
+        def run():
+            reference = before() if before is not None else None
+            device.swipe(p1, p2, **kwargs)
+            if after is not None:
+                after(reference)
+            return p1, p2
+
+        return self.submit(run)
+
+    def wait(self, timeout: float = None):
+        """
+        Block until all queued gestures are finished.
+        """
+        if self.in_flight:
+            self.submit(lambda: None).result(timeout)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
@@ -0,0 +1,177 @@
+import time
+from typing import Callable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from zafkiel.config import Config
+from zafkiel.context import current_context
+
+
+class Frame(np.ndarray):
+    """
+    Screenshot with capture information, works wherever a numpy image does.
+
+    Derived images (grayscale, HSV, downscaled) are computed on first request and memoized on the frame,
+    so each conversion runs at most once per frame however many templates and OCR are checked.
+    Crops of a frame are views, they take their derived images from the frame they come from.
+    Frames must not be modified in place after derived images are requested.
+
+    Attributes:
+        timestamp: Time of capture.
+        input_in_flight: True if a queued gesture was still being performed when captured,
+            the screen may be changing.
+        frame_no: Sequence number of the frame on a frame bus, -1 if not from one.
+    """
+
+    def __new__(cls, image, input_in_flight: bool = False, timestamp: float = None, frame_no: int = -1):
+        frame = np.asarray(image).view(cls)
+        frame.input_in_flight = input_in_flight
+        frame.timestamp = time.time() if timestamp is None else timestamp
+        frame.frame_no = frame_no
+        frame._root = None
+        frame._cache = {}
+        return frame
+
+    def __array_finalize__(self, obj):
+        # Views and crops keep the information of the frame they come from
+        self.input_in_flight = getattr(obj, 'input_in_flight', False)
+        self.timestamp = getattr(obj, 'timestamp', 0.)
+        self.frame_no = getattr(obj, 'frame_no', -1)
+        # Derived images of a view are taken from its root frame, never from a cache of its own
+        self._cache = {}
+        self._root = None
+        if isinstance(obj, Frame) and self.base is not None:
+            root = obj._root if obj._root is not None else obj
+            # Results of numpy operations are also finalized from the frame, but do not share its memory
+            if np.may_share_memory(self, root):
+                self._root = root
+
+    def _region(self) -> Optional[Tuple['Frame', int, int]]:
+        """
+        Returns:
+            Root frame and (y, x) of this view in it, or None if this is not a plain crop of the root.
+        """
+        root = self._root
+        if root is None or root.ndim < 2 or self.ndim != root.ndim:
+            return None
+        if self.strides != root.strides or self.shape[2:] != root.shape[2:]:
+            return None
+        offset = self.__array_interface__['data'][0] - root.__array_interface__['data'][0]
+        if offset < 0 or offset >= root.nbytes:
+            return None
+        y, rest = divmod(offset, root.strides[0])
+        x = rest // root.strides[1]
+        if y + self.shape[0] > root.shape[0] or x + self.shape[1] > root.shape[1]:
+            return None
+        return root, y, x
+
+    def _derived(self, key, func: Callable[[np.ndarray], np.ndarray], croppable: bool = True) -> np.ndarray:
+        region = self._region() if croppable else None
+        if region is not None:
+            root, y, x = region
+            return root._derived(key, func)[y:y + self.shape[0], x:x + self.shape[1]]
+        image = self._cache.get(key)
+        if image is None:
+            image = self._cache[key] = func(self.view(np.ndarray))
+        return image
+
+    def gray(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Grayscale image, converted the same way as airtest.
+        """
+        if self.ndim == 2:
+            return self.view(np.ndarray)
+        return self._derived('gray', lambda image: cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+
+    def hsv(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: HSV image.
+        """
+        return self._derived('hsv', lambda image: cv2.cvtColor(image, cv2.COLOR_BGR2HSV))
+
+    def _child(self, image: np.ndarray) -> 'Frame':
+        return Frame(image, input_in_flight=self.input_in_flight, timestamp=self.timestamp, frame_no=self.frame_no)
+
+    def resized(self, scale: float) -> 'Frame':
+        """
+        Args:
+            scale: Ratio to the size of this frame, usually less than 1.
+
+        Returns:
+            Frame resized by `scale`, which memoizes its own derived images.
+        """
+        if scale == 1:
+            return self
+        level = {0.5: 1, 0.25: 2}.get(scale)
+        if level is not None:
+            return self.pyramid(level)
+
+        def resize(image):
+            h, w = image.shape[:2]
+            size = max(1, round(w * scale)), max(1, round(h * scale))
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+            return self._child(cv2.resize(image, size, interpolation=interpolation))
+
+        # Resized crops cannot be taken from the resized root without rounding errors
+        return self._derived(('resized', scale), resize, croppable=False)
+
+    def pyramid(self, level: int) -> 'Frame':
+        """
+        Args:
+            level: 1 for 1/2 scale, 2 for 1/4 scale, etc.
+
+        Returns:
+            Frame downscaled by 2 ** level, each level is computed from the previous one.
+        """
+        if level <= 0:
+            return self
+
+        def down(_):
+            image = self.pyramid(level - 1)
+            h, w = image.shape[:2]
+            return self._child(cv2.resize(image, (max(1, w // 2), max(1, h // 2)), interpolation=cv2.INTER_AREA))
+
+        return self._derived(('pyramid', level), down, croppable=False)
+
+
+def to_gray(image) -> np.ndarray:
+    """
+    Returns:
+        Grayscale image, memoized if image is a Frame.
+    """
+    if isinstance(image, Frame):
+        return image.gray()
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def to_hsv(image) -> np.ndarray:
+    """
+    Returns:
+        HSV image, memoized if image is a Frame.
+    """
+    if isinstance(image, Frame):
+        return image.hsv()
+    return cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+
+
+def capture() -> Optional[Frame]:
+    """
+    Returns:
+        Screenshot of the device of current context as a Frame, or None if screen is None.
+    """
+    context = current_context()
+    in_flight = context.executor.in_flight
+    screen = context.device.snapshot(filename=None, quality=Config.ST.SNAPSHOT_QUALITY)
+    if screen is None:
+        return None
+    in_flight = in_flight or context.executor.in_flight
+    if isinstance(screen, Frame):
+        # Keep frame number and capture time given by the device, e.g. `FrameBusDevice`
+        screen.input_in_flight = in_flight
+        return screen
+    return Frame(screen, input_in_flight=in_flight)
@@ -0,0 +1,378 @@
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Iterable, Optional, Tuple, Union
+
+import numpy as np
+from airtest import aircv
+
+from zafkiel.context import current_device
+from zafkiel.device.capture import CaptureBackend, FileCapture
+from zafkiel.device.frame import Frame
+from zafkiel.exception import ScriptError
+from zafkiel.logger import logger
+
+MAGIC = b'ZFB1'
+# magic, slots, max height, max width, max channels, latest frame number
+_HEADER = struct.Struct('<4s4Iq')
+# seqlock version, frame number, timestamp, height, width, channels
+_SLOT = struct.Struct('<QqdIII')
+_HEADER_SIZE = 64
+_SLOT_HEADER_SIZE = 64
+
+
+_attach_lock = threading.Lock()
+
+
+def _attach(name: str) -> SharedMemory:
+    """
+    Attach to an existing shared memory without letting this process unlink it on exit.
+    """
+    try:
+        return SharedMemory(name, track=False)
+    except TypeError:
+        pass
+
+    # Python < 3.13 registers attached memory to resource tracker, which unlinks it when this process exits.
+    # Registration is skipped instead of undone, since unregistering would also drop the registration of
+    # the publisher if it shares the resource tracker, i.e. in the same process or a spawned child.
+    def register(registered, rtype):
+        if rtype == 'shared_memory' and registered.lstrip('/') == name.lstrip('/'):
+            return
+        original(registered, rtype)
+
+    with _attach_lock:
+        original = resource_tracker.register
+        resource_tracker.register = register
+        try:
+            return SharedMemory(name)
+        finally:
+            resource_tracker.register = original
+
+
+class _Ring:
+    """
+    Layout of a frame ring in shared memory:
+
+        header | slot 0 header | slot 0 pixels | slot 1 header | slot 1 pixels | ...
+
+    A slot is written under a seqlock, its version is odd while being written.
+    Latest frame number in header is updated after the slot is committed.
+    """
+
+    def __init__(self, shm: SharedMemory):
+        self.shm = shm
+        magic, self.slots, self.max_height, self.max_width, self.max_channels, _ = _HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC:
+            raise ScriptError(f'Shared memory {shm.name} is not a frame bus')
+        self.frame_size = self.max_height * self.max_width * self.max_channels
+        self.slot_stride = _SLOT_HEADER_SIZE + self.frame_size
+
+    @staticmethod
+    def size(slots: int, shape: Tuple[int, int, int]) -> int:
+        return _HEADER_SIZE + slots * (_SLOT_HEADER_SIZE + int(np.prod(shape)))
+
+    def slot_offset(self, frame_no: int) -> int:
+        return _HEADER_SIZE + (frame_no % self.slots) * self.slot_stride
+
+    def latest(self) -> int:
+        return _HEADER.unpack_from(self.shm.buf, 0)[5]
+
+    def read_slot(self, offset: int) -> tuple:
+        return _SLOT.unpack_from(self.shm.buf, offset)
+
+    def pixels(self, offset: int, height: int, width: int, channels: int) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Read-only view over the shared buffer.
+        """
+        image = np.ndarray((height, width, channels), dtype=np.uint8, buffer=self.shm.buf,
+                           offset=offset + _SLOT_HEADER_SIZE)
+        image.flags.writeable = False
+        return image if channels != 1 else image[:, :, 0]
+
+
+class FramePublisher:
+    """
+    Write captured frames into a ring of slots in shared memory,
+    so that a bot, a dashboard and a recorder can all read the same frames without capturing again.
+
+    Examples:
+        # Capture process
+        publisher = FramePublisher('zafkiel-mumu-0', shape=(720, 1280, 3))
+        publisher.run()     # snapshot of current device, forever
+
+        # Any other process
+        with DeviceContext(FrameBusDevice(FrameSubscriber('zafkiel-mumu-0'), device=G.DEVICE)):
+            loop_find(Template(r"START.png"))
+    """
+
+    def __init__(self, name: str, shape: Tuple[int, int, int] = (1080, 1920, 3), slots: int = 4):
+        """
+        Args:
+            name: Name of shared memory, subscribers attach by it.
+            shape: Maximum (height, width, channels) of frames.
+            slots: Frames kept in ring, a zero-copy frame stays valid until `slots - 1` newer frames are published.
+        """
+        if len(shape) == 2:
+            shape = (*shape, 1)
+        self.shape = tuple(int(i) for i in shape)
+        self.shm = SharedMemory(name, create=True, size=_Ring.size(slots, self.shape))
+        _HEADER.pack_into(self.shm.buf, 0, MAGIC, slots, *self.shape, -1)
+        self.ring = _Ring(self.shm)
+        self.frame_no = -1
+        self.stopped = threading.Event()
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def publish(self, image: np.ndarray, timestamp: float = None) -> int:
+        """
+        Args:
+            image: BGR or grayscale uint8 image no larger than `shape`.
+            timestamp: Time of capture, None for now.
+
+        Returns:
+            Frame number of the published frame.
+        """
+        if image.ndim == 2:
+            image = image[:, :, None]
+        height, width, channels = image.shape
+        if height > self.shape[0] or width > self.shape[1] or channels > self.shape[2]:
+            raise ScriptError(f'Frame {image.shape} exceeds frame bus shape {self.shape}')
+        if timestamp is None:
+            timestamp = getattr(image, 'timestamp', None) or time.time()
+
+        frame_no = self.frame_no + 1
+        buf = self.shm.buf
+        offset = self.ring.slot_offset(frame_no)
+        version = _SLOT.unpack_from(buf, offset)[0]
+        # Odd version while writing
+        _SLOT.pack_into(buf, offset, version + 1, frame_no, timestamp, height, width, channels)
+        view = np.ndarray((height, width, channels), dtype=np.uint8, buffer=buf, offset=offset + _SLOT_HEADER_SIZE)
+        np.copyto(view, image)
+        _SLOT.pack_into(buf, offset, version + 2, frame_no, timestamp, height, width, channels)
+        struct.pack_into('<q', buf, _HEADER.size - 8, frame_no)
+        self.frame_no = frame_no
+        return frame_no
+
+    def run(
+            self,
+            source: Union[Callable[[], Optional[np.ndarray]], CaptureBackend] = None,
+            interval: float = 0.,
+            count: int = None,
+    ):
+        """
+        Publish frames until `stop()` is called or source is exhausted.
+
+        Args:
+            source: Returns the next frame, None to skip, raises StopIteration when exhausted.
+                A CaptureBackend to publish its grabs of the whole screen.
+                None to take snapshots of the device of current context.
+            interval: Seconds to sleep between two frames.
+            count: Number of frames to publish, None for no limit.
+        """
+        if isinstance(source, CaptureBackend):
+            source = source.grab
+        elif source is None:
+            device = current_device()
+
+            def source():
+                return device.snapshot(filename=None)
+
+        published = 0
+        while not self.stopped.is_set() and (count is None or published < count):
+            try:
+                image = source()
+            except StopIteration:
+                break
+            if image is not None:
+                self.publish(image)
+                published += 1
+            if interval:
+                self.stopped.wait(interval)
+
+    def stop(self):
+        self.stopped.set()
+
+    def close(self):
+        """
+        Release and remove the shared memory, subscribers that are still attached keep their mapping.
+        """
+        self.stop()
+        self.ring = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> 'FramePublisher':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def file_source(files: Iterable[str], loop: bool = True) -> Callable[[], np.ndarray]:
+    """
+    Feed `FramePublisher.run()` from image files, e.g. to test consumers without a device.
+
+    Args:
+        files: Image files, read once.
+        loop: True to restart from the first file when exhausted.
+    """
+    return FileCapture(files, loop=loop).grab
+
+
+class FrameSubscriber:
+    """
+    Read frames published by `FramePublisher` in another process, as numpy views over the shared buffer.
+    """
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: Name of shared memory given to `FramePublisher`.
+        """
+        self.shm = _attach(name)
+        self.ring = _Ring(self.shm)
+
+    def _read(self, frame_no: int, copy: bool) -> Optional[Frame]:
+        offset = self.ring.slot_offset(frame_no)
+        for _ in range(100):
+            version, slot_frame_no, timestamp, height, width, channels = self.ring.read_slot(offset)
+            if slot_frame_no != frame_no:
+                # Overwritten by a newer frame
+                return None
+            if version & 1:
+                continue
+            image = self.ring.pixels(offset, height, width, channels)
+            if copy:
+                image = image.copy()
+            if self.ring.read_slot(offset)[0] == version:
+                return Frame(image, timestamp=timestamp, frame_no=frame_no)
+        return None
+
+    def latest(self, copy: bool = False, timeout: float = 1.) -> Optional[Frame]:
+        """
+        Args:
+            copy: False to return a read-only view over the shared buffer,
+                valid until `slots - 1` newer frames are published, see `is_valid()`.
+            timeout: Seconds to wait for a frame being written to be committed.
+
+        Returns:
+            Latest frame with its `frame_no` and `timestamp`, or None if nothing is published yet
+            or the latest frame is never committed, e.g. publisher died while writing it.
+        """
+        deadline = time.time() + timeout
+        while True:
+            frame_no = self.ring.latest()
+            if frame_no < 0:
+                return None
+            frame = self._read(frame_no, copy)
+            if frame is not None:
+                return frame
+            if time.time() > deadline:
+                logger.warning(f'Frame {frame_no} on frame bus {self.shm.name} is not committed in {timeout}s')
+                return None
+            time.sleep(0.001)
+
+    def wait_next(self, after: int, timeout: float = 1., copy: bool = False) -> Optional[Frame]:
+        """
+        Args:
+            after: Frame number already consumed, -1 for any.
+            timeout: Seconds to wait.
+            copy: Same as `latest()`.
+
+        Returns:
+            Latest frame newer than `after`, or None if timeout.
+        """
+        deadline = time.time() + timeout
+        while True:
+            if self.ring.latest() > after:
+                frame = self.latest(copy=copy)
+                if frame is not None and frame.frame_no > after:
+                    return frame
+            if time.time() > deadline:
+                return None
+            time.sleep(0.001)
+
+    def is_valid(self, frame: Frame) -> bool:
+        """
+        Returns:
+            If a zero-copy frame has not been overwritten yet.
+        """
+        version, slot_frame_no, *_ = self.ring.read_slot(self.ring.slot_offset(frame.frame_no))
+        return slot_frame_no == frame.frame_no and not version & 1
+
+    def close(self):
+        """
+        Frames from `latest()` must not be used after close.
+        """
+        self.ring = None
+        self.shm.close()
+
+    def __enter__(self) -> 'FrameSubscriber':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FrameBusDevice:
+    """
+    Device whose snapshots come from a frame bus, other operations are forwarded to `device`.
+
+    Examples:
+        with DeviceContext(FrameBusDevice(FrameSubscriber('zafkiel-mumu-0'), device=G.DEVICE)):
+            touch(Template(r"START.png"))
+    """
+
+    def __init__(self, subscriber: FrameSubscriber, device=None, timeout: float = 1., copy: bool = False):
+        """
+        Args:
+            subscriber:
+            device: Device to perform input and queries on, None for a capture only device.
+            timeout: Seconds to wait for a frame newer than the last snapshot before returning the latest one.
+            copy: Same as `FrameSubscriber.latest()`.
+        """
+        self.subscriber = subscriber
+        self.device = device
+        self.timeout = timeout
+        self.copy = copy
+        self.last_frame_no = -1
+
+    def __getattr__(self, item):
+        device = self.__dict__.get('device')
+        if device is None:
+            raise AttributeError(item)
+        return getattr(device, item)
+
+    def snapshot(self, filename=None, quality=10, max_size=None):
+        frame = self.subscriber.wait_next(self.last_frame_no, timeout=self.timeout, copy=self.copy)
+        if frame is None:
+            frame = self.subscriber.latest(copy=self.copy)
+            if frame is None:
+                logger.warning('No frame published on frame bus')
+                return None
+        self.last_frame_no = frame.frame_no
+        if filename:
+            aircv.imwrite(filename, np.ascontiguousarray(frame), quality, max_size=max_size)
+        return frame
+
+    def get_current_resolution(self) -> Tuple[int, int]:
+        if self.device is not None:
+            return self.device.get_current_resolution()
+        frame = self.subscriber.latest()
+        if frame is None:
+            raise ScriptError('No frame published on frame bus')
+        return frame.shape[1], frame.shape[0]
+
+    def real_resolution(self) -> Tuple[int, int]:
+        if self.device is not None:
+            return self.device.real_resolution()
+        return self.get_current_resolution()
@@ -0,0 +1,283 @@
+import itertools
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from multiprocessing.connection import wait
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Tuple, Type
+
+import numpy as np
+
+from zafkiel.config import Config
+from zafkiel.device.cv import score_screen
+from zafkiel.device.frame import Frame
+from zafkiel.device.template import ImageTemplate as Template, cv_match, resize_template
+from zafkiel.exception import ScriptError
+from zafkiel.ocr.ocr import Ocr
+from zafkiel.utils import crop, is_color_similar
+
+
+def _forget(templates: dict, resized: dict, key: int):
+    templates.pop(key, None)
+    for resized_key in [k for k in resized if k[0] == key]:
+        del resized[resized_key]
+
+
+def _worker(conn):
+    """
+    Match requests of `MatchPool` until None is received.
+
+    Messages:
+        ('template', key, image, params): Keep a template resident.
+        ('forget', key): Drop a template.
+        ('frame', name, shape): A new frame is in shared memory `name`.
+        ('release', name): Shared memory `name` is no longer used.
+        ('match', task, key, name, area, screen_resolution, threshold, settings): Reply (task, result, error).
+    """
+    templates = {}
+    # Key: (key, screen resolution, resize method). Value: resized template image
+    resized = {}
+    # Key: shared memory name. Value: [SharedMemory, Frame]
+    frames = {}
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        kind = message[0]
+        if kind == 'template':
+            _, key, image, params = message
+            # Key may be reused by another template after `forget`
+            _forget(templates, resized, key)
+            templates[key] = (Frame(image), params)
+        elif kind == 'forget':
+            _forget(templates, resized, message[1])
+        elif kind == 'frame':
+            _, name, shape = message
+            entry = frames.get(name)
+            if entry is None:
+                # Spawned workers share the resource tracker of the pool, which unlinks the memory on close
+                entry = frames[name] = [SharedMemory(name), None]
+            buffer = np.ndarray(shape, dtype=np.uint8, buffer=entry[0].buf)
+            buffer.flags.writeable = False
+            # New Frame for each frame, so memoized gray images of the last one are dropped
+            entry[1] = Frame(buffer)
+        elif kind == 'release':
+            entry = frames.pop(message[1], None)
+            if entry is not None:
+                entry[1] = None
+                entry[0].close()
+        elif kind == 'match':
+            _, task, key, name, area, screen_resolution, threshold, (strategies, resize_method) = message
+            try:
+                image, params = templates[key]
+                resized_key = (key, screen_resolution, resize_method)
+                image_resized = resized.get(resized_key)
+                if image_resized is None:
+                    image_resized = resized[resized_key] = Frame(
+                        resize_template(image, params['resolution'], screen_resolution, resize_method))
+                screen = frames[name][1]
+                if area is not None:
+                    x1, y1, x2, y2 = area
+                    screen = screen[y1:y2, x1:x2]
+                result = cv_match(image, image_resized, screen, strategies, threshold=threshold, **params)
+                conn.send((task, result, None))
+            except Exception as e:
+                conn.send((task, None, f'{type(e).__name__}: {e}'))
+
+    for entry in frames.values():
+        entry[1] = None
+        entry[0].close()
+
+
+class MatchPool:
+    """
+    Match many templates on one screenshot in worker processes, for CPU heavy strategies like akaze and sift
+    that hold the GIL.
+
+    Each frame is copied into shared memory once, templates are sent to workers once and stay there
+    until `unregister()` or until more than `max_templates` are registered.
+    Search areas and resolutions depend on the device and are computed in the calling process.
+    OCR keyword templates and color checks also run in the calling process.
+
+    Examples:
+        with MatchPool(processes=8) as pool:
+            positions = pool.match(TEMPLATES, screenshot())
+    """
+
+    # Templates kept in workers, least recently matched ones are dropped above it
+    max_templates = 512
+    # Match tasks sent to a worker before reading its replies, so neither side blocks on a full pipe
+    max_in_flight = 4
+
+    def __init__(self, processes: int = None):
+        """
+        Args:
+            processes: Number of worker processes, None for CPU count.
+        """
+        self.processes = processes or os.cpu_count() or 1
+        context = multiprocessing.get_context('spawn')
+        self.connections = []
+        self.workers = []
+        for _ in range(self.processes):
+            parent, child = context.Pipe()
+            worker = context.Process(target=_worker, args=(child,), daemon=True)
+            worker.start()
+            child.close()
+            self.connections.append(parent)
+            self.workers.append(worker)
+
+        # Key: id(template). Value: template, kept alive so its id is not reused, least recently matched first
+        self._templates: OrderedDict[int, Template] = OrderedDict()
+        # Shared memory blocks reused across frames, one per distinct downscaled frame in a call
+        self._blocks: list[SharedMemory] = []
+        self._tasks = itertools.count()
+        self._lock = threading.Lock()
+
+    def _broadcast(self, message):
+        for conn in self.connections:
+            conn.send(message)
+
+    def _register(self, template: Template) -> int:
+        key = id(template)
+        if key in self._templates:
+            self._templates.move_to_end(key)
+            return key
+
+        params = dict(rgb=template.rgb, record_pos=template.record_pos, resolution=template.resolution,
+                      scale_max=template.scale_max, scale_step=template.scale_step)
+        self._broadcast(('template', key, np.asarray(template.image), params))
+        self._templates[key] = template
+        while len(self._templates) > self.max_templates:
+            # Workers handle messages in order, so tasks already sent still find it
+            evicted, _ = self._templates.popitem(last=False)
+            self._broadcast(('forget', evicted))
+        return key
+
+    def unregister(self, templates: list):
+        """
+        Drop templates from workers, e.g. when leaving a task that used them.
+        """
+        with self._lock:
+            for template in templates:
+                key = id(template)
+                if self._templates.pop(key, None) is not None:
+                    self._broadcast(('forget', key))
+
+    def _publish(self, index: int, frame) -> str:
+        """
+        Copy frame into the index-th shared memory block and tell workers.
+
+        Returns:
+            Name of the block.
+        """
+        frame = np.ascontiguousarray(frame)
+        if index < len(self._blocks) and self._blocks[index].size < frame.nbytes:
+            block = self._blocks.pop(index)
+            self._broadcast(('release', block.name))
+            block.close()
+            block.unlink()
+        if index >= len(self._blocks):
+            self._blocks.insert(index, SharedMemory(create=True, size=frame.nbytes))
+        block = self._blocks[index]
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=block.buf)[:] = frame
+        self._broadcast(('frame', block.name, frame.shape))
+        return block.name
+
+    def score(self, templates: list, screen, cls: Type[Ocr] = Ocr) -> list[Tuple[Optional[Tuple[int, int]], float]]:
+        """
+        Same as `score_screen()` on each template.
+
+        Args:
+            templates: image templates to be found in screenshot
+            screen: screenshot
+            cls: "Ocr" class or its subclass
+
+        Returns:
+            Position and confidence of each template in order, (None, 0.) for those not found.
+        """
+        results: list[Tuple[Optional[Tuple[int, int]], float]] = [(None, 0.)] * len(templates)
+        with self._lock:
+            settings = (list(Config.ST.CVSTRATEGY), Config.ST.RESIZE_METHOD)
+            # Key: scale. Value: (shared memory name, downscaled frame)
+            frames = {}
+            pending = {}
+            # Key: connection. Value: number of tasks sent and not replied
+            in_flight = {conn: 0 for conn in self.connections}
+            errors = []
+            keyword_indexes = []
+
+            def receive():
+                for conn in wait([conn for conn, count in in_flight.items() if count]):
+                    task, match_result, error = conn.recv()
+                    in_flight[conn] -= 1
+                    index, v, area, scale = pending.pop(task)
+                    if error is not None:
+                        errors.append(f'Matching <{v.name}> failed in worker: {error}')
+                    elif match_result:
+                        revise_coord = area[:2] if area is not None else (0, 0)
+                        results[index] = v.focus_pos(match_result, revise_coord, scale), match_result['confidence']
+
+            for index, v in enumerate(templates):
+                if v.keyword is not None:
+                    keyword_indexes.append(index)
+                    continue
+                if v.rgb and not is_color_similar(v.image, crop(screen, v.area)):
+                    continue
+
+                frame, scale = v.match_frame(screen)
+                if scale not in frames:
+                    frames[scale] = (self._publish(len(frames), frame), frame)
+                name, frame = frames[scale]
+                area = v.search_area(frame, scale) if v.local_search else None
+                key = self._register(v)
+                # Least busy worker, drain replies if all of them are full
+                conn = min(self.connections, key=in_flight.__getitem__)
+                while in_flight[conn] >= self.max_in_flight:
+                    receive()
+                    conn = min(self.connections, key=in_flight.__getitem__)
+                task = next(self._tasks)
+                pending[task] = (index, v, area, scale)
+                in_flight[conn] += 1
+                conn.send(('match', task, key, name, area, tuple(v.match_resolution(scale)), v.threshold, settings))
+
+            # OCR while workers are matching
+            for index in keyword_indexes:
+                results[index] = score_screen(templates[index], screen, cls=cls)
+
+            # Receive all replies even if some failed, so none is left for the next call
+            while pending:
+                receive()
+        if errors:
+            raise ScriptError(errors[0])
+        return results
+
+    def match(self, templates: list, screen, cls: Type[Ocr] = Ocr) -> list[Optional[Tuple[int, int]]]:
+        """
+        Returns:
+            Position of each template in order, None for those not found.
+        """
+        return [pos for pos, _ in self.score(templates, screen, cls=cls)]
+
+    def close(self):
+        with self._lock:
+            for conn in self.connections:
+                try:
+                    conn.send(None)
+                except (OSError, ValueError):
+                    pass
+            for worker in self.workers:
+                worker.join(timeout=5)
+            for conn in self.connections:
+                conn.close()
+            for block in self._blocks:
+                block.close()
+                block.unlink()
+            self._blocks = []
+            self._templates = OrderedDict()
+
+    def __enter__(self) -> 'MatchPool':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
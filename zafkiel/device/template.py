@@ -1,10 +1,12 @@
 import os
+import time
 import types
 from functools import cached_property
 from pathlib import Path
 from typing import Optional, Tuple
 
 import cv2
+from airtest.aircv.template_matching import TemplateMatching
 from airtest.core.cv import Template, MATCHING_METHODS
 from airtest.core.error import InvalidMatchingMethodError
 from airtest.core.helper import G, logwrap
@@ -12,9 +14,98 @@ from airtest.utils.transform import TargetPos
 from numpy import ndarray
 
 from zafkiel.config import Config
+from zafkiel.context import current_device
+from zafkiel.decorator import device_cached_property
+from zafkiel.device.frame import Frame, to_gray
 from zafkiel.ocr.keyword import Keyword
 
 
+def resize_template(image, resolution, screen_resolution, resize_method):
+    """
+    Scale a template image from the resolution it was taken at to screen resolution.
+    """
+    if not resolution:
+        return image
+
+    if tuple(resolution) == tuple(screen_resolution) or resize_method is None:
+        return image
+    if isinstance(resize_method, types.MethodType):
+        resize_method = resize_method.__func__
+
+    # default to using cocos_min_strategy:
+    h, w = image.shape[:2]
+    w_re, h_re = resize_method(w, h, resolution, screen_resolution)
+    w_re, h_re = max(1, w_re), max(1, h_re)
+    G.LOGGING.debug("resize: (%s, %s)->(%s, %s), resolution: %s=>%s" % (
+                    w, h, w_re, h_re, resolution, screen_resolution))
+
+    image = cv2.resize(image, (w_re, h_re))
+    return image
+
+
+def match_gray(image, screen, threshold: float) -> Optional[dict]:
+    """
+    Same as airtest `TemplateMatching(rgb=False).find_best_result()`,
+    but takes grayscale images memoized on frames instead of converting them on every call.
+    """
+    start_time = time.time()
+    h, w = image.shape[:2]
+    if h > screen.shape[0] or w > screen.shape[1]:
+        G.LOGGING.debug("error: in template match, found im_search bigger than im_source.")
+        return None
+    res = cv2.matchTemplate(to_gray(screen), to_gray(image), cv2.TM_CCOEFF_NORMED)
+    _, confidence, _, max_loc = cv2.minMaxLoc(res)
+    x_min, y_min = max_loc
+    rectangle = ((x_min, y_min), (x_min, y_min + h), (x_min + w, y_min + h), (x_min + w, y_min))
+    result = dict(result=(int(x_min + w / 2), int(y_min + h / 2)), rectangle=rectangle, confidence=confidence,
+                  time=time.time() - start_time)
+    G.LOGGING.debug("[Template] threshold=%s, result=%s" % (threshold, result))
+    return result if confidence >= threshold else None
+
+
+def cv_match(ori_image, image, screen, strategies, threshold: float, rgb: bool, record_pos, resolution,
+             scale_max: int, scale_step: float) -> Optional[dict]:
+    """
+    Match a template image in screen with matching strategies in order, until one of them matches.
+    Does not depend on the device, so it can run in worker processes.
+
+    Args:
+        ori_image: Template image at the resolution it was taken at.
+        image: Template image scaled to screen resolution.
+        screen: Screen or search area of it.
+        strategies: Names in MATCHING_METHODS, usually `Config.ST.CVSTRATEGY`.
+        threshold:
+        rgb:
+        record_pos:
+        resolution: Resolution `ori_image` was taken at.
+        scale_max:
+        scale_step:
+
+    Returns:
+        Match result like airtest, or None.
+    """
+    ret = None
+    for method in strategies:
+        # get function definition and execute:
+        func = MATCHING_METHODS.get(method, None)
+        if func is None:
+            raise InvalidMatchingMethodError(
+                "Undefined method in CVSTRATEGY: '%s', try 'kaze'/'brisk'/'akaze'/'orb'/'surf'/'sift'/'brief' instead." % method)
+        else:
+            if method in ["mstpl", "gmstpl"]:
+                ret = Template._try_match(func, ori_image, screen, threshold=threshold, rgb=rgb,
+                                          record_pos=record_pos,
+                                          resolution=resolution, scale_max=scale_max,
+                                          scale_step=scale_step)
+            elif func is TemplateMatching and not rgb:
+                ret = match_gray(image, screen, threshold)
+            else:
+                ret = Template._try_match(func, image, screen, threshold=threshold, rgb=rgb)
+        if ret:
+            break
+    return ret
+
+
 class ImageTemplate(Template):
     def __init__(
             self,
@@ -29,13 +120,16 @@ class ImageTemplate(Template):
             threshold: Optional[float] = None,
             target_pos: int = TargetPos.MID,
             scale_max: int = 800,
-            scale_step: float = 0.005
+            scale_step: float = 0.005,
+            single_line: bool = False
     ):
         """
         Args:
             local_search: True if you only want to search for template image at the corresponding positions on the screen,
                 otherwise it will search the entire screen.
             ocr_mode: Ocr match rules, one of 0/1/2, which means `OCR_EQUAL`, `OCR_CONTAINS`, `OCR_SIMILAR`.
+            single_line: True if the template area holds exactly one line of text, keyword matching with
+                `local_search` will then run text recognition only and skip text detection.
         """
 
         super().__init__(filename, threshold, target_pos, record_pos, resolution, rgb, scale_max, scale_step)
@@ -43,6 +137,7 @@ class ImageTemplate(Template):
         self.template_path = template_path  # under root path
         self.local_search = local_search
         self.ocr_mode = ocr_mode
+        self.single_line = single_line
         self.keyword = keyword
         if self.keyword is not None and self.keyword.name == '':
             """
@@ -69,8 +164,8 @@ class ImageTemplate(Template):
         return Path(self.filename).stem
 
     @cached_property
-    def image(self) -> ndarray:
-        return self._imread()
+    def image(self) -> Frame:
+        return Frame(self._imread())
 
     @cached_property
     def height(self) -> int:
@@ -80,7 +175,7 @@ class ImageTemplate(Template):
     def width(self) -> int:
         return self.image.shape[1]
 
-    @cached_property
+    @device_cached_property
     def border(self) -> tuple[int, int, int]:
         """
         If running in a bordered window, coordinates need to be corrected.
@@ -88,8 +183,9 @@ class ImageTemplate(Template):
         Returns:
             Top, left and bottom boundary pixel values on the current screen.
         """
-        real_resolution = G.DEVICE.real_resolution()
-        screenshot_resolution = G.DEVICE.get_current_resolution()
+        device = current_device()
+        real_resolution = device.real_resolution()
+        screenshot_resolution = device.get_current_resolution()
 
         border_other = (screenshot_resolution[0] - real_resolution[0]) / 2
         border_top = screenshot_resolution[1] - real_resolution[1] - border_other
@@ -102,11 +198,11 @@ class ImageTemplate(Template):
         """
         if screen_height is None:
             border = self.border[0] + self.border[2]
-            screen_height = G.DEVICE.get_current_resolution()[1] - border
+            screen_height = current_device().get_current_resolution()[1] - border
 
         return screen_height / self.resolution[1]
 
-    @cached_property
+    @device_cached_property
     def area(self) -> tuple:
         """
         Calculate the area of the template image on the current screen.
@@ -114,7 +210,7 @@ class ImageTemplate(Template):
         Returns:
             Upper left and lower right corner coordinate.
         """
-        screen_resolution = G.DEVICE.get_current_resolution()
+        screen_resolution = current_device().get_current_resolution()
 
         screen_width = screen_resolution[0] - self.border[1] * 2
         screen_height = screen_resolution[1] - self.border[0] - self.border[2]
@@ -126,77 +222,111 @@ class ImageTemplate(Template):
         y2 = screen_height / 2 + self.record_pos[1] * screen_width + self.height / 2 * ratio + self.border[0]
         return x1, y1, x2, y2
 
+    def match_scale(self) -> float:
+        """
+        Returns:
+            Ratio screen is downscaled by before template matching, according to `Config.MATCH_RESOLUTION`.
+            1 for full size.
+        """
+        height = Config.MATCH_RESOLUTION
+        if height is None:
+            return 1.
+        if height == 'template':
+            height = self.resolution[1]
+        screen_height = current_device().get_current_resolution()[1] - self.border[0] - self.border[2]
+        return min(height / screen_height, 1.)
+
     def match_in(self, screen, local_search=True):
+        result = self.score_in(screen, local_search)
+        if result is None:
+            return None
+        return result[0]
+
+    def score_in(self, screen, local_search=True) -> Optional[Tuple[Tuple[int, int], float]]:
+        """
+        Returns:
+            Focus position and confidence of the match, or None if not matched.
+        """
+        screen, scale = self.match_frame(screen)
         revise_coord = (0, 0)
         if local_search:
-            # search area is a little larger than the template image area
-            x1, y1, x2, y2 = map(int, self.area)
-            width_increase = (x2 - x1) * 0.2
-            height_increase = (y2 - y1) * 0.2
-            x1 = int(max(x1 - width_increase, 0))
-            y1 = int(max(y1 - height_increase, 0))
-            x2 = int(min(x2 + width_increase, screen.shape[1]))
-            y2 = int(min(y2 + height_increase, screen.shape[0]))
-
+            x1, y1, x2, y2 = self.search_area(screen, scale)
             revise_coord = x1, y1
             screen = screen[y1:y2, x1:x2]
 
-        screen_resolution = G.DEVICE.get_current_resolution()
-        screen_width = screen_resolution[0] - self.border[1] * 2
-        screen_height = screen_resolution[1] - self.border[0] - self.border[2]
-
-        match_result = self._cv_match(screen, (screen_width, screen_height))
+        match_result = self._cv_match(screen, self.match_resolution(scale))
         G.LOGGING.debug("match result: %s", match_result)
         if not match_result:
             return None
-        focus_pos = TargetPos().getXY(match_result, self.target_pos)
+        return self.focus_pos(match_result, revise_coord, scale), match_result['confidence']
 
-        if local_search:
-            focus_pos = focus_pos[0] + revise_coord[0], focus_pos[1] + revise_coord[1]
+    def match_frame(self, screen) -> Tuple[Frame, float]:
+        """
+        Returns:
+            Screen to match in, downscaled according to `Config.MATCH_RESOLUTION`, and the scale.
+        """
+        scale = self.match_scale()
+        if scale < 1:
+            # Memoized on frame, so screen is downscaled once for all templates
+            screen = (screen if isinstance(screen, Frame) else Frame(screen)).resized(scale)
+        return screen, scale
 
+    def search_area(self, screen, scale: float = 1.) -> Tuple[int, int, int, int]:
+        """
+        Returns:
+            Area to search in `screen` from `match_frame()`, a little larger than the template image area.
+        """
+        x1, y1, x2, y2 = (int(i * scale) for i in self.area)
+        width_increase = (x2 - x1) * 0.2
+        height_increase = (y2 - y1) * 0.2
+        x1 = int(max(x1 - width_increase, 0))
+        y1 = int(max(y1 - height_increase, 0))
+        x2 = int(min(x2 + width_increase, screen.shape[1]))
+        y2 = int(min(y2 + height_increase, screen.shape[0]))
+        return x1, y1, x2, y2
+
+    def match_resolution(self, scale: float = 1.) -> Tuple[int, int]:
+        """
+        Returns:
+            Screen resolution without border that the template image is scaled to.
+        """
+        screen_resolution = current_device().get_current_resolution()
+        screen_width = screen_resolution[0] - self.border[1] * 2
+        screen_height = screen_resolution[1] - self.border[0] - self.border[2]
+        if scale < 1:
+            screen_width, screen_height = round(screen_width * scale), round(screen_height * scale)
+        return screen_width, screen_height
+
+    def focus_pos(self, match_result: dict, revise_coord=(0, 0), scale: float = 1.) -> Tuple[int, int]:
+        """
+        Returns:
+            Target position of a match result in full size screen coordinates.
+        """
+        focus_pos = TargetPos().getXY(match_result, self.target_pos)
+        focus_pos = focus_pos[0] + revise_coord[0], focus_pos[1] + revise_coord[1]
+        if scale < 1:
+            focus_pos = int(focus_pos[0] / scale), int(focus_pos[1] / scale)
         return focus_pos
 
+    def _resized(self, screen_resolution) -> Frame:
+        """
+        Template image scaled to screen resolution, memoized with its derived images.
+        """
+        cache = self.__dict__.setdefault('_resized_cache', {})
+        key = (tuple(screen_resolution), Config.ST.RESIZE_METHOD)
+        image = cache.get(key)
+        if image is None:
+            image = cache[key] = Frame(self._resize_image(self.image, screen_resolution, Config.ST.RESIZE_METHOD))
+        return image
+
     @logwrap
     def _cv_match(self, screen, screen_resolution):
-        ori_image = self.image
-        image = self._resize_image(ori_image, screen_resolution, Config.ST.RESIZE_METHOD)
-        ret = None
-        for method in Config.ST.CVSTRATEGY:
-            # get function definition and execute:
-            func = MATCHING_METHODS.get(method, None)
-            if func is None:
-                raise InvalidMatchingMethodError(
-                    "Undefined method in CVSTRATEGY: '%s', try 'kaze'/'brisk'/'akaze'/'orb'/'surf'/'sift'/'brief' instead." % method)
-            else:
-                if method in ["mstpl", "gmstpl"]:
-                    ret = self._try_match(func, ori_image, screen, threshold=self.threshold, rgb=self.rgb,
-                                          record_pos=self.record_pos,
-                                          resolution=self.resolution, scale_max=self.scale_max,
-                                          scale_step=self.scale_step)
-                else:
-                    ret = self._try_match(func, image, screen, threshold=self.threshold, rgb=self.rgb)
-            if ret:
-                break
-        return ret
+        return cv_match(self.image, self._resized(screen_resolution), screen, Config.ST.CVSTRATEGY,
+                        threshold=self.threshold, rgb=self.rgb, record_pos=self.record_pos,
+                        resolution=self.resolution, scale_max=self.scale_max, scale_step=self.scale_step)
 
     def _resize_image(self, image, screen_resolution, resize_method):
         """
         Scale the template image to the current screen resolution.
         """
-        if not self.resolution:
-            return image
-
-        if tuple(self.resolution) == tuple(screen_resolution) or resize_method is None:
-            return image
-        if isinstance(resize_method, types.MethodType):
-            resize_method = resize_method.__func__
-
-        # default to using cocos_min_strategy:
-        h, w = image.shape[:2]
-        w_re, h_re = resize_method(w, h, self.resolution, screen_resolution)
-        w_re, h_re = max(1, w_re), max(1, h_re)
-        G.LOGGING.debug("resize: (%s, %s)->(%s, %s), resolution: %s=>%s" % (
-                        w, h, w_re, h_re, self.resolution, screen_resolution))
-
-        image = cv2.resize(image, (w_re, h_re))
-        return image
+        return resize_template(image, self.resolution, screen_resolution, resize_method)
@@ -4,16 +4,19 @@ from typing import Tuple
 from airtest import aircv
 from airtest.core.win.win import Windows, require_app
 from airtest.utils.snippet import get_absolute_coordinate
-import mss
-import numpy
 from pyautogui import dragTo, moveTo
 from pytweening import easeOutQuad
 import win32api
 import win32gui
 import win32con
 
+from zafkiel.device.capture import CaptureBackend, MssCapture
+
 
 class WindowsPlatform(Windows):
+    # Created on first snapshot, set to another CaptureBackend to change how screen is captured
+    capture: CaptureBackend = None
+
     @require_app
     def is_foreground(self):
         """
@@ -190,12 +193,12 @@ class WindowsPlatform(Windows):
             }
         else:
             monitor = self.screen.monitors[0]
-        with mss.mss() as sct:
-            sct_img = sct.grab(monitor)
-            screen = numpy.array(sct_img, dtype=numpy.uint8)[..., :3]
-            if filename:
-                aircv.imwrite(filename, screen, quality, max_size=max_size)
-            return screen
+        if self.capture is None:
+            self.capture = MssCapture()
+        screen = self.capture.grab(monitor)
+        if filename and screen is not None:
+            aircv.imwrite(filename, screen, quality, max_size=max_size)
+        return screen
 
     def touch(self, pos, **kwargs):
         """
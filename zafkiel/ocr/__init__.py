@@ -4,5 +4,6 @@ only modified to fit the project and:
 delete some methods
 add Ocr.ocr_match_keyword()
 """
+from zafkiel.ocr.glyph import GlyphModel
 from zafkiel.ocr.keyword import Keyword
 from zafkiel.ocr.ocr import Ocr, Digit, DigitCounter, Duration, OcrResultButton
@@ -0,0 +1,137 @@
+import cv2
+import numpy as np
+
+from zafkiel.device.frame import to_gray
+from zafkiel.exception import ScriptError
+
+
+class GlyphModel:
+    """
+    Recognize single line text in a fixed game font, such as counters `14/15`,
+    by matching each glyph against glyph templates learned from a few labelled crops.
+
+    Glyphs are split by column projection of the binarized image, so characters must not touch each other.
+    Exposes `ocr_single_line()` and `ocr_lines()` like `TextSystem`, and can be used as `Ocr.model`.
+
+    Examples:
+        model = GlyphModel()
+        model.learn(crop(screenshot, COUNTER.area), '14/15')
+        model.learn(crop(screenshot2, COUNTER.area), '0/9')
+        model.save('counter_glyphs.npz')
+
+        counter = DigitCounter(COUNTER, glyphs=GlyphModel.load('counter_glyphs.npz'))
+    """
+
+    def __init__(self, glyph_size: tuple[int, int] = (16, 24), min_score: float = 0.6):
+        """
+        Args:
+            glyph_size: (width, height) glyphs are normalized to.
+            min_score: Glyphs whose best normalized cross correlation is lower are dropped.
+        """
+        self.glyph_size = tuple(glyph_size)
+        self.min_score = min_score
+        self.labels: list[str] = []
+        self.templates = np.zeros((0, self.glyph_size[0] * self.glyph_size[1]), dtype=np.float32)
+
+    @staticmethod
+    def binarize(image) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Bool mask of text pixels, Otsu threshold with the minority side taken as text.
+        """
+        image = to_gray(image)
+        _, mask = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        mask = mask > 0
+        if np.count_nonzero(mask) > mask.size / 2:
+            mask = ~mask
+        return mask
+
+    def segment(self, image) -> np.ndarray:
+        """
+        Split image into glyphs by column projection.
+
+        Returns:
+            np.ndarray: (n, width * height) normalized glyph vectors, from left to right.
+        """
+        if image is None or image.size == 0:
+            return np.zeros((0, self.templates.shape[1]), dtype=np.float32)
+        mask = self.binarize(image)
+        rows = np.flatnonzero(mask.any(axis=1))
+        if not len(rows):
+            return np.zeros((0, self.templates.shape[1]), dtype=np.float32)
+        # Keep glyphs in the line height, so `-` and `1` stay different
+        mask = mask[rows[0]:rows[-1] + 1]
+
+        columns = np.concatenate([[False], mask.any(axis=0), [False]]).astype(np.int8)
+        edges = np.flatnonzero(np.diff(columns))
+        return np.stack([self._normalize(mask[:, x1:x2]) for x1, x2 in edges.reshape(-1, 2)])
+
+    def _normalize(self, glyph) -> np.ndarray:
+        width, height = self.glyph_size
+        h, w = glyph.shape
+        scale = min(width / w, height / h)
+        w_re, h_re = max(1, round(w * scale)), max(1, round(h * scale))
+        glyph = cv2.resize(glyph.astype(np.float32), (w_re, h_re), interpolation=cv2.INTER_AREA)
+        canvas = np.zeros((height, width), dtype=np.float32)
+        x, y = (width - w_re) // 2, (height - h_re) // 2
+        canvas[y:y + h_re, x:x + w_re] = glyph
+
+        vector = canvas.ravel()
+        vector -= vector.mean()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def learn(self, image, text: str) -> 'GlyphModel':
+        """
+        Add glyph templates from a labelled crop.
+
+        Args:
+            image: Crop of a single text line.
+            text: Text on it, spaces are ignored.
+
+        Raises:
+            ScriptError: If the number of glyphs found does not match text.
+        """
+        chars = [char for char in text if not char.isspace()]
+        glyphs = self.segment(image)
+        if len(glyphs) != len(chars):
+            raise ScriptError(f'GlyphModel found {len(glyphs)} glyphs but got label "{text}"')
+        self.labels.extend(chars)
+        self.templates = np.concatenate([self.templates, glyphs])
+        return self
+
+    def ocr_single_line(self, image) -> tuple[str, float]:
+        """
+        Returns:
+            Text and score, score is the mean correlation of recognized glyphs.
+        """
+        glyphs = self.segment(image)
+        if not len(glyphs) or not len(self.labels):
+            return '', 0.
+        # Normalized cross correlation of every glyph against every template
+        ncc = glyphs @ self.templates.T
+        best = ncc.argmax(axis=1)
+        scores = ncc[np.arange(len(glyphs)), best]
+        keep = scores >= self.min_score
+        if not keep.any():
+            return '', 0.
+        text = ''.join(self.labels[i] for i in best[keep])
+        return text, float(scores[keep].mean())
+
+    def ocr_lines(self, img_list) -> list[tuple[str, float]]:
+        return [self.ocr_single_line(image) for image in img_list]
+
+    def detect_and_ocr(self, image):
+        raise ScriptError('GlyphModel does not support text detection, use ocr_single_line()')
+
+    def save(self, file):
+        np.savez(file, labels=np.array(self.labels), templates=self.templates,
+                 glyph_size=np.array(self.glyph_size), min_score=self.min_score)
+
+    @classmethod
+    def load(cls, file) -> 'GlyphModel':
+        data = np.load(file)
+        model = cls(glyph_size=tuple(int(i) for i in data['glyph_size']), min_score=float(data['min_score']))
+        model.labels = [str(label) for label in data['labels']]
+        model.templates = data['templates'].astype(np.float32)
+        return model
@@ -1,10 +1,12 @@
 import re
+from collections import defaultdict
 from dataclasses import dataclass
 from functools import cached_property
 from typing import ClassVar
 
 from zafkiel.config import Config
 from zafkiel.exception import ScriptError
+from zafkiel.ocr.similarity import SIMILAR_LEVENSHTEIN, similarity_many
 
 REGEX_PUNCTUATION = re.compile(r'[ ,.\'"“”，。:：!！?？·•\-—/\\\n\t()\[\]（）「」『』【】《》［］]')
 
@@ -14,6 +16,97 @@ def parse_name(n):
     return n
 
 
+def _index_langs(lang: str = None) -> tuple:
+    """
+    Languages searched by `Keyword.keywords_to_find()` under `lang`.
+    """
+    if lang is None:
+        return 'cn',
+    if lang in ('cn', 'en', 'jp', 'cht'):
+        return lang,
+    return 'cn', 'en', 'jp', 'cht'
+
+
+def _ngrams(text: str, n: int = 2) -> set:
+    """
+    Character n-grams of text, padded so that short texts still produce grams.
+    """
+    text = f'\x02{text}\x03'
+    return {text[i:i + n] for i in range(max(len(text) - n + 1, 1))}
+
+
+class KeywordIndex:
+    """
+    Lookup tables over the `instances` of a `Keyword` class.
+
+    Exact texts are hashed per (lang, ignore_punctuation), so `Keyword.find()` no longer scans every instance,
+    and texts are also indexed by character bigrams to fetch candidates for similarity lookup.
+    Instances are added in `Keyword.__post_init__()`, the index is rebuilt lazily if an instance gets replaced.
+    """
+
+    def __init__(self, instances: dict):
+        self.instances = instances
+        # Key: (lang, ignore_punctuation). Value: dict of text -> (order, instance)
+        self.exact = defaultdict(dict)
+        # Key: (lang, ignore_punctuation). Value: dict of n-gram -> list of (order, text, instance)
+        self.grams = defaultdict(lambda: defaultdict(list))
+        self.size = 0
+        self.dirty = False
+
+    def add(self, instance) -> None:
+        for lang in ('cn', 'en', 'jp', 'cht'):
+            for ignore_punctuation in (True, False):
+                key = (lang, ignore_punctuation)
+                text = instance.keywords_to_find(lang=lang, ignore_punctuation=ignore_punctuation)[0]
+                self.exact[key].setdefault(text, (self.size, instance))
+                for gram in _ngrams(text):
+                    self.grams[key][gram].append((self.size, text, instance))
+        self.size += 1
+
+    def rebuild(self) -> None:
+        self.exact.clear()
+        self.grams.clear()
+        self.size = 0
+        self.dirty = False
+        for instance in self.instances.values():
+            self.add(instance)
+
+    def ensure(self) -> None:
+        if self.dirty or self.size != len(self.instances):
+            self.rebuild()
+
+    def get(self, text: str, lang: str = None, ignore_punctuation: bool = True):
+        """
+        Returns:
+            The first registered instance that has `text` in any of the searched languages, or None.
+        """
+        self.ensure()
+        found = None
+        for lang in _index_langs(lang):
+            row = self.exact[(lang, ignore_punctuation)].get(text)
+            if row is not None and (found is None or row[0] < found[0]):
+                found = row
+        return found[1] if found is not None else None
+
+    def candidates(self, text: str, lang: str = None, ignore_punctuation: bool = True) -> list:
+        """
+        Returns:
+            list[tuple[str, Keyword]]: Keyword texts sharing at least one bigram with `text`,
+                most shared bigrams first, then in registration order.
+        """
+        self.ensure()
+        shared = {}
+        for lang in _index_langs(lang):
+            postings = self.grams[(lang, ignore_punctuation)]
+            for gram in _ngrams(text):
+                for order, keyword, instance in postings.get(gram, ()):
+                    key = (keyword, order)
+                    row = shared.get(key)
+                    shared[key] = (row[0] + 1, instance) if row is not None else (1, instance)
+        rows = sorted(shared.items(), key=lambda row: (-row[1][0], row[0][1]))
+        return [(keyword, instance) for (keyword, _), (_, instance) in rows]
+
+
 @dataclass
 class Keyword:
     cn: str = ''
@@ -122,7 +215,27 @@ class Keyword:
     instances: ClassVar = {}
 
     def __post_init__(self):
+        index = self.__class__._index()
+        if self.name in self.__class__.instances:
+            # Replacing an instance changes its search order, rebuild on next lookup
+            index.dirty = True
         self.__class__.instances[self.name] = self
+        if not index.dirty:
+            index.add(self)
+
+    @classmethod
+    def _index(cls) -> KeywordIndex:
+        """
+        Returns:
+            Index of `instances`, shared among the classes sharing the same `instances` dict.
+        """
+        owner = next(c for c in cls.__mro__ if 'instances' in c.__dict__)
+        index = owner.__dict__.get('_keyword_index')
+        if index is None or index.instances is not owner.instances:
+            index = KeywordIndex(owner.instances)
+            index.dirty = True
+            owner._keyword_index = index
+        return index
 
     @classmethod
     def _compare(cls, name, keyword):
@@ -148,6 +261,9 @@ class Keyword:
 
         # Probably a variable name
         if isinstance(name, str) and '_' in name:
+            instance = cls.instances.get(name)
+            if instance is not None and instance.name == name:
+                return instance
             for instance in cls.instances.values():
                 if name == instance.name:
                     return instance
@@ -156,12 +272,58 @@ class Keyword:
             name = parse_name(name)
         else:
             name = str(name)
-        instance: Keyword
-        for instance in cls.instances.values():
-            for keyword in instance.keywords_to_find(
-                    lang=lang, ignore_punctuation=ignore_punctuation):
-                if cls._compare(name, keyword):
-                    return instance
+        if cls._compare.__func__ is Keyword._compare.__func__:
+            instance = cls._index().get(name, lang=lang, ignore_punctuation=ignore_punctuation)
+            if instance is not None:
+                return instance
+        else:
+            # `_compare` is overridden, hash lookup does not apply
+            instance: Keyword
+            for instance in cls.instances.values():
+                for keyword in instance.keywords_to_find(
+                        lang=lang, ignore_punctuation=ignore_punctuation):
+                    if cls._compare(name, keyword):
+                        return instance
 
         # Not found
         raise ScriptError(f'Cannot find a {cls.__name__} instance that matches "{name}"')
+
+    @classmethod
+    def find_similar(cls, name, lang: str = None, threshold: float = 0.75, ignore_punctuation: bool = True,
+                     metric: str = SIMILAR_LEVENSHTEIN):
+        """
+        Find the instance whose name is the most similar to `name`.
+        Only instances sharing at least one character bigram with `name` are compared,
+        which never misses a match under `SIMILAR_LEVENSHTEIN` with `threshold` >= 0.5.
+
+        Args:
+            name: Name in any server.
+            lang: Lang to find from. None to search the names from current server only.
+            threshold: Minimum similarity in [0, 1].
+            ignore_punctuation: True to remove punctuations and turn into lowercase before searching.
+            metric: `SIMILAR_LEVENSHTEIN` or `SIMILAR_DIFFLIB`.
+
+        Returns:
+            Keyword instance.
+
+        Raises:
+            ScriptError: If nothing similar enough.
+        """
+        if isinstance(name, Keyword):
+            return name
+
+        name = parse_name(name) if ignore_punctuation else str(name)
+        index = cls._index()
+        instance = index.get(name, lang=lang, ignore_punctuation=ignore_punctuation)
+        if instance is not None:
+            return instance
+
+        candidates = index.candidates(name, lang=lang, ignore_punctuation=ignore_punctuation)
+        if candidates:
+            similarities = similarity_many(name, [keyword for keyword, _ in candidates], threshold=threshold,
+                                           metric=metric)
+            best = int(similarities.argmax())
+            if similarities[best] >= threshold:
+                return candidates[best][1]
+
+        raise ScriptError(f'Cannot find a {cls.__name__} instance similar to "{name}"')
@@ -1,7 +1,17 @@
+import threading
+from collections import OrderedDict
+from typing import Union
+
+import psutil
 from pponnxcr import TextSystem as TextSystem_
+from pponnxcr.det import TextDetector
+from pponnxcr.rec import TextRecognizer
+from pponnxcr.utility import LANG
 
-from zafkiel.decorator import cached_property
+from zafkiel.config import Config
 from zafkiel.exception import ScriptError
+from zafkiel.logger import logger
+from zafkiel.ocr.server import RemoteTextSystem
 
 DIC_LANG_TO_MODEL = {
     'cn': 'zhs',
@@ -37,40 +47,168 @@ def model2lang(model: str) -> str:
 
 
 class TextSystem(TextSystem_):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    def __init__(self, lang: str, manager: 'OcrModel' = None):
+        """
+        Args:
+            lang: Model name, defined in pponnxcr.utility
+            manager: Model manager to get the shared text detector from, None to own a detector.
+        """
+        # Not calling super().__init__(), which would load a detector for every model
+        self.lang = lang
+        self.manager = manager
+        self.text_recognizer = TextRecognizer(lang)
         self.text_recognizer.rec_batch_num = 1
+        self.use_angle_cls = False
+        self._text_detector = None
+
+    @property
+    def text_detector(self) -> TextDetector:
+        """
+        Loaded on first text detection, models using the same detector share one session.
+        """
+        if self.manager is not None:
+            return self.manager.get_detector(self.lang)
+        if self._text_detector is None:
+            self._text_detector = TextDetector(self.lang)
+        return self._text_detector
+
+
+def _rss() -> float:
+    """
+    Returns:
+        Resident memory of current process in MB.
+    """
+    return psutil.Process().memory_info().rss / 1024 / 1024
 
 
 class OcrModel:
-    def get_by_model(self, model: str) -> TextSystem:
-        try:
-            return self.__getattribute__(model)
-        except AttributeError:
-            raise ScriptError(f'OCR model "{model}" does not exists')
+    """
+    Load OCR models on demand, keep recognizers in LRU order and unload the least recently used ones
+    when resident memory exceeds `Config.OCR_MEMORY_BUDGET`.
+    Text detectors are shared among models using the same detection model file.
+
+    If `Config.OCR_SERVER` is set, models are not loaded but served by `zafkiel.ocr.server`.
+    """
 
-    def get_by_lang(self, lang: str) -> TextSystem:
+    # Models that are loaded from another model
+    MODEL_ALIAS = {
+        'ja': 'zht',
+    }
+
+    def __init__(self):
+        # Key: model name. Value: TextSystem, least recently used first
+        self._models: OrderedDict[str, TextSystem] = OrderedDict()
+        # Key: detection model file. Value: TextDetector
+        self._detectors: dict[str, TextDetector] = {}
+        # Key: 'rec:{model}' or 'det:{file}'. Value: resident memory in MB measured on load
+        self.memory: dict[str, float] = {}
+        # Key: (server address, model name). Value: RemoteTextSystem
+        self._remote: dict[tuple[str, str], RemoteTextSystem] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _detector_key(model: str) -> str:
+        return LANG[model]['det']
+
+    def get_detector(self, model: str) -> TextDetector:
+        key = self._detector_key(model)
+        with self._lock:
+            detector = self._detectors.get(key)
+            if detector is None:
+                before = _rss()
+                detector = TextDetector(model)
+                self._detectors[key] = detector
+                self.memory[f'det:{key}'] = max(_rss() - before, 0.)
+                logger.info(f'OCR detector {key} loaded, {self.memory[f"det:{key}"]:.1f}MB')
+                self._evict()
+            return detector
+
+    def get_by_model(self, model: str) -> Union[TextSystem, RemoteTextSystem]:
+        model = self.MODEL_ALIAS.get(model, model)
+        if model not in LANG:
+            raise ScriptError(f'OCR model "{model}" does not exists')
+        address = Config.OCR_SERVER
+        if address is None:
+            return self.get_local(model)
+        with self._lock:
+            text_system = self._remote.get((address, model))
+            if text_system is None:
+                text_system = self._remote[(address, model)] = RemoteTextSystem(model, address)
+            return text_system
+
+    def get_local(self, model: str) -> TextSystem:
+        """
+        Load model in current process regardless of `Config.OCR_SERVER`.
+        """
+        model = self.MODEL_ALIAS.get(model, model)
+        if model not in LANG:
+            raise ScriptError(f'OCR model "{model}" does not exists')
+        with self._lock:
+            text_system = self._models.get(model)
+            if text_system is not None:
+                self._models.move_to_end(model)
+                return text_system
+
+            before = _rss()
+            text_system = TextSystem(model, manager=self)
+            self._models[model] = text_system
+            self.memory[f'rec:{model}'] = max(_rss() - before, 0.)
+            logger.info(f'OCR model {model} loaded, {self.memory[f"rec:{model}"]:.1f}MB')
+            self._evict()
+            return text_system
+
+    def get_by_lang(self, lang: str) -> Union[TextSystem, RemoteTextSystem]:
         try:
-            model = lang2model(lang)
-            return self.__getattribute__(model)
-        except AttributeError:
+            return self.get_by_model(lang2model(lang))
+        except ScriptError:
             raise ScriptError(f'OCR model under lang "{lang}" does not exists')
 
-    @cached_property
+    def memory_usage(self) -> dict[str, float]:
+        """
+        Returns:
+            Resident memory in MB of each loaded model, measured on load.
+        """
+        with self._lock:
+            return dict(self.memory)
+
+    def unload(self, model: str):
+        """
+        Unload a recognizer, and its detector if no other loaded model uses it.
+        """
+        model = self.MODEL_ALIAS.get(model, model)
+        with self._lock:
+            if self._models.pop(model, None) is not None:
+                self.memory.pop(f'rec:{model}', None)
+                logger.info(f'OCR model {model} unloaded')
+            used = {self._detector_key(name) for name in self._models}
+            for key in list(self._detectors):
+                if key not in used:
+                    del self._detectors[key]
+                    self.memory.pop(f'det:{key}', None)
+
+    def _evict(self):
+        budget = Config.OCR_MEMORY_BUDGET
+        if budget is None:
+            return
+        # Always keep the most recently used model
+        while len(self._models) > 1 and sum(self.memory.values()) > budget:
+            self.unload(next(iter(self._models)))
+
+    @property
     def zhs(self):
-        return TextSystem('zhs')
+        return self.get_by_model('zhs')
 
-    @cached_property
+    @property
     def en(self):
-        return TextSystem('en')
+        return self.get_by_model('en')
 
-    @cached_property
+    @property
     def ja(self):
-        return TextSystem('zht')
+        return self.get_by_model('ja')
 
-    @cached_property
+    @property
     def zht(self):
-        return TextSystem('zht')
+        return self.get_by_model('zht')
 
 
 OCR_MODEL = OcrModel()
@@ -1,20 +1,21 @@
 import re
 import time
 from datetime import timedelta
-from difflib import SequenceMatcher
-from typing import Optional
+from typing import Optional, Union
 
 from pponnxcr.predict_system import BoxedResult
 
 from zafkiel.logger import logger
 from zafkiel.config import Config
-from zafkiel.decorator import cached_property
 from zafkiel.device.template import ImageTemplate
 from zafkiel.exception import ScriptError
+from zafkiel.ocr.glyph import GlyphModel
 from zafkiel.ocr.keyword import Keyword
 from zafkiel.ocr.models import TextSystem, OCR_MODEL
+from zafkiel.ocr.preprocess import IDENTITY, PreProcess
+from zafkiel.ocr.similarity import SIMILAR_DIFFLIB, similarity_many
 from zafkiel.ocr.utils import merge_buttons, corner2area, area_pad
-from zafkiel.utils import crop
+from zafkiel.utils import crop, image_hash, hash_distance
 
 OCR_EQUAL = 0
 OCR_CONTAINS = 1
@@ -65,6 +66,19 @@ class Ocr:
     # Merge results with box distance <= thres
     merge_thres_x = 0
     merge_thres_y = 0
+    # Metric of `OCR_SIMILAR` matching, `SIMILAR_DIFFLIB` or `SIMILAR_LEVENSHTEIN`.
+    # Thresholds mean different things under each metric, re-tune them when opting into `SIMILAR_LEVENSHTEIN`.
+    similar_metric = SIMILAR_DIFFLIB
+    # True to detect text boxes once and only recognize them on later frames, for areas whose layout doesn't change.
+    # Text detection reruns if the hash of the area is farther than `track_hash_thres` from the one at detection,
+    # or if any tracked box is recognized with a score lower than `track_score_thres`.
+    track_boxes = False
+    track_hash_thres = 6
+    track_score_thres = 0.5
+    # Glyph template model to use instead of the OCR model, None to use the OCR model of `lang`
+    glyphs: Optional[GlyphModel] = None
+    # Steps run after `pre_process()`, e.g. PreProcess(ContrastStretch(), CropToInk(), ScaleToHeight())
+    pre_process_steps: Optional[PreProcess] = None
 
     def __init__(self, button: ImageTemplate, lang=None, name=None):
         """
@@ -82,8 +96,15 @@ class Ocr:
         self.lang: str = lang
         self.name: str = name
 
-    @cached_property
-    def model(self) -> TextSystem:
+        # Text boxes from last text detection, see `track_boxes`
+        self._tracked_boxes: Optional[list] = None
+        self._tracked_hash = None
+        self._tracked_shape = None
+
+    @property
+    def model(self) -> Union[TextSystem, GlyphModel]:
+        if self.glyphs is not None:
+            return self.glyphs
         return OCR_MODEL.get_by_lang(self.lang)
 
     @staticmethod
@@ -106,11 +127,21 @@ class Ocr:
         """
         return result
 
+    def _run_steps(self, image) -> tuple:
+        """
+        Returns:
+            Image processed by `pre_process_steps` and the mapping of its coordinates back to `image`.
+        """
+        if self.pre_process_steps is None:
+            return image, IDENTITY
+        return self.pre_process_steps.apply(image)
+
     def ocr_single_line(self, image):
         # pre process
         start_time = time.time()
         image = crop(image, self.button.area)
         image = self.pre_process(image)
+        image, _ = self._run_steps(image)
         # ocr
         result, _ = self.model.ocr_single_line(image)
         # after proces
@@ -121,6 +152,32 @@ class Ocr:
         logger.debug(f'OCR <{self.name}> cost {cost_time:.2f}s: {result}')
         return result
 
+    def recognize_single_line(self, image) -> list[BoxedResult]:
+        """
+        Treat `button` area as a single text line and run text recognition only, without text detection.
+
+        Args:
+            image: Screenshot
+
+        Returns:
+            A list with one BoxedResult covering the whole `button` area, or empty list if nothing recognized.
+        """
+        # pre process
+        start_time = time.time()
+        image = crop(image, self.button.area)
+        image = self.pre_process(image)
+        image, _ = self._run_steps(image)
+        # ocr
+        text, score = self.model.ocr_single_line(image)
+        # after proces
+        text = self.after_process(text)
+
+        cost_time = time.time() - start_time
+        logger.debug(f'OCR <{self.name}> single line cost {cost_time:.2f}s: {text}')
+        if not text:
+            return []
+        return [BoxedResult(tuple(int(round(x)) for x in self.button.area), image, text, score)]
+
     def filter_detected(self, result: BoxedResult) -> bool:
         """
         Return False to drop result.
@@ -143,7 +200,16 @@ class Ocr:
             image = crop(image, self.button.area)
         image = self.pre_process(image)
         # ocr
-        results: list[BoxedResult] = self.model.detect_and_ocr(image)
+        results: Optional[list[BoxedResult]] = None
+        if self.track_boxes:
+            results = self._ocr_tracked(image)
+        if results is None:
+            processed, mapping = self._run_steps(image)
+            results = self.model.detect_and_ocr(processed)
+            for result in results:
+                result.box = PreProcess.map_back(result.box, mapping)
+            if self.track_boxes:
+                self._track(image, results)
         # after proces
         for result in results:
             if not direct_ocr:
@@ -159,6 +225,47 @@ class Ocr:
         logger.debug(f"OCR <{self.name}> cost {cost_time:.2f}s: {', '.join([result.text for result in results])}")
         return results
 
+    def _track(self, image, results: list[BoxedResult]):
+        """
+        Remember text boxes of a detection, in the coordinates of `image`.
+        """
+        if results:
+            self._tracked_boxes = [result.box.copy() for result in results]
+            self._tracked_hash = image_hash(image)
+            self._tracked_shape = image.shape
+        else:
+            self.reset_tracking()
+
+    def reset_tracking(self):
+        """
+        Forget tracked text boxes, next `detect_and_ocr()` will run text detection.
+        """
+        self._tracked_boxes = None
+        self._tracked_hash = None
+        self._tracked_shape = None
+
+    def _ocr_tracked(self, image) -> Optional[list[BoxedResult]]:
+        """
+        Recognize tracked text boxes without text detection.
+
+        Returns:
+            Results in the same format as `TextSystem.detect_and_ocr()`,
+            or None if layout seems changed and text detection is required.
+        """
+        if self._tracked_boxes is None or image.shape != self._tracked_shape:
+            return None
+        if hash_distance(image_hash(image), self._tracked_hash) > self.track_hash_thres:
+            logger.debug(f'OCR <{self.name}> layout changed, redetect')
+            return None
+
+        images = [self._run_steps(crop(image, corner2area(box)))[0] for box in self._tracked_boxes]
+        rec_results = self.model.ocr_lines(images)
+        if any(score < self.track_score_thres for _, score in rec_results):
+            logger.debug(f'OCR <{self.name}> tracked boxes got low score, redetect')
+            return None
+        return [BoxedResult(box.copy(), img, text, score)
+                for box, img, (text, score) in zip(self._tracked_boxes, images, rec_results)]
+
     @staticmethod
     def _match_result(
             result: str,
@@ -275,6 +382,8 @@ class Ocr:
             -> list[OcrResultButton]:
         """
         Match a specified keyword instance on the screen.
+        If `button.single_line` is set and `direct_ocr` is False, recognition only is tried first,
+        text detection is used only if that fails to match.
 
         Args:
             image: Screenshot
@@ -286,20 +395,13 @@ class Ocr:
         Returns:
             List of matched OcrResultButton or empty list.
         """
-        boxed_results = self.detect_and_ocr(image, direct_ocr=direct_ocr)
         final_results = []
-        for boxed_result in boxed_results:
-            for keyword in keyword_instance.keywords_to_find():
-                if mode == OCR_EQUAL and boxed_result.text != keyword:
-                    continue
-                elif mode == OCR_CONTAINS and keyword not in boxed_result.text:
-                    continue
-                elif mode == OCR_SIMILAR:
-                    similarity = SequenceMatcher(None, boxed_result.text, keyword).ratio()
-                    if similarity < threshold:
-                        continue
-                button = OcrResultButton(boxed_result, keyword_instance)
-                final_results.append(button)
+        if not direct_ocr and self.button.single_line:
+            boxed_results = self.recognize_single_line(image)
+            final_results = self._match_keyword(boxed_results, keyword_instance, mode=mode, threshold=threshold)
+        if not final_results:
+            boxed_results = self.detect_and_ocr(image, direct_ocr=direct_ocr)
+            final_results = self._match_keyword(boxed_results, keyword_instance, mode=mode, threshold=threshold)
 
         if final_results:
             logger.debug(f"<{self.name}> matched: {', '.join([str(result) for result in final_results])}")
@@ -307,10 +409,33 @@ class Ocr:
         #     logger.debug(f"<{self.name}> matching failed")
         return final_results
 
+    def _match_keyword(self, boxed_results: list[BoxedResult], keyword_instance, mode: int = OCR_EQUAL,
+                       threshold=0.75) -> list[OcrResultButton]:
+        keywords = keyword_instance.keywords_to_find()
+        final_results = []
+        for boxed_result in boxed_results:
+            if mode == OCR_SIMILAR:
+                similarities = similarity_many(boxed_result.text, keywords, threshold=threshold,
+                                               metric=self.similar_metric)
+                matched = similarities >= threshold
+            elif mode == OCR_CONTAINS:
+                matched = [keyword in boxed_result.text for keyword in keywords]
+            else:
+                matched = [boxed_result.text == keyword for keyword in keywords]
+            for is_matched in matched:
+                if is_matched:
+                    final_results.append(OcrResultButton(boxed_result, keyword_instance))
+        return final_results
+
 
 class Digit(Ocr):
-    def __init__(self, button: ImageTemplate, lang='en', name=None):
+    def __init__(self, button: ImageTemplate, lang='en', name=None, glyphs: Optional[GlyphModel] = None):
+        """
+        Args:
+            glyphs: Read with a `GlyphModel` instead of the OCR model, set `glyphs` to None to switch back.
+        """
         super().__init__(button, lang=lang, name=name)
+        self.glyphs = glyphs
 
     def format_result(self, result) -> int:
         """
@@ -329,8 +454,13 @@ class Digit(Ocr):
 
 
 class DigitCounter(Ocr):
-    def __init__(self, button: ImageTemplate, lang='en', name=None):
+    def __init__(self, button: ImageTemplate, lang='en', name=None, glyphs: Optional[GlyphModel] = None):
+        """
+        Args:
+            glyphs: Read with a `GlyphModel` instead of the OCR model, set `glyphs` to None to switch back.
+        """
         super().__init__(button, lang=lang, name=name)
+        self.glyphs = glyphs
 
     def format_result(self, result) -> tuple[int, int, int]:
         """
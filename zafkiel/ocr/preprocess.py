@@ -0,0 +1,176 @@
+import cv2
+import numpy as np
+
+from zafkiel.device.frame import to_gray
+
+# (scale_x, scale_y, offset_x, offset_y), maps a point in processed image back to input image:
+# x_input = x * scale_x + offset_x
+IDENTITY = (1., 1., 0., 0.)
+
+
+def _gray(image) -> np.ndarray:
+    return to_gray(image)
+
+
+def _bgr(image) -> np.ndarray:
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    return image
+
+
+class Step:
+    """
+    A step of `PreProcess`.
+    """
+
+    def apply(self, image) -> tuple[np.ndarray, tuple]:
+        """
+        To be overridden.
+
+        Returns:
+            Processed image and the mapping of its coordinates back to `image`.
+        """
+        return image, IDENTITY
+
+    def __call__(self, image) -> np.ndarray:
+        return self.apply(image)[0]
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}()'
+
+
+class Grayscale(Step):
+    def apply(self, image):
+        return _bgr(_gray(image)), IDENTITY
+
+
+class Invert(Step):
+    def apply(self, image):
+        return 255 - image, IDENTITY
+
+
+class ContrastStretch(Step):
+    def __init__(self, low: float = 1, high: float = 99):
+        """
+        Args:
+            low: Percentile mapped to 0.
+            high: Percentile mapped to 255.
+        """
+        self.low = low
+        self.high = high
+
+    def apply(self, image):
+        low, high = np.percentile(image, (self.low, self.high))
+        if high <= low:
+            return image, IDENTITY
+        lut = np.clip((np.arange(256) - low) * (255 / (high - low)), 0, 255).astype(np.uint8)
+        return lut[image], IDENTITY
+
+
+class Binarize(Step):
+    def __init__(self, threshold: int = None):
+        """
+        Args:
+            threshold: Gray level threshold, None to use Otsu's method.
+        """
+        self.threshold = threshold
+
+    def apply(self, image):
+        gray = _gray(image)
+        if self.threshold is None:
+            _, image = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        else:
+            _, image = cv2.threshold(gray, self.threshold, 255, cv2.THRESH_BINARY)
+        return _bgr(image), IDENTITY
+
+
+class CropToInk(Step):
+    def __init__(self, threshold: int = 48, pad: int = 4):
+        """
+        Crop to the bounding box of pixels differing from the background,
+        background is the median gray level of the image border.
+
+        Args:
+            threshold: Minimum gray level difference from background to be considered as ink.
+            pad: Pixels kept around the ink.
+        """
+        self.threshold = threshold
+        self.pad = pad
+
+    def apply(self, image):
+        gray = _gray(image)
+        h, w = gray.shape
+        if h == 0 or w == 0:
+            return image, IDENTITY
+        border = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+        ink = np.abs(gray.astype(np.int16) - int(np.median(border))) > self.threshold
+        rows = np.flatnonzero(ink.any(axis=1))
+        columns = np.flatnonzero(ink.any(axis=0))
+        if not len(rows):
+            return image, IDENTITY
+        x1, x2 = max(columns[0] - self.pad, 0), min(columns[-1] + 1 + self.pad, w)
+        y1, y2 = max(rows[0] - self.pad, 0), min(rows[-1] + 1 + self.pad, h)
+        return image[y1:y2, x1:x2], (1., 1., float(x1), float(y1))
+
+
+class ScaleToHeight(Step):
+    def __init__(self, height: int = 48):
+        """
+        Args:
+            height: Output height, default to the input height of pponnxcr recognition models.
+        """
+        self.height = height
+
+    def apply(self, image):
+        h, w = image.shape[:2]
+        if h == self.height or h == 0 or w == 0:
+            return image, IDENTITY
+        scale = self.height / h
+        w_re = max(1, round(w * scale))
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        image = cv2.resize(image, (w_re, self.height), interpolation=interpolation)
+        return image, (w / w_re, h / self.height, 0., 0.)
+
+
+class PreProcess:
+    """
+    Pre process steps run in order, to be declared on `Ocr` subclasses instead of overriding `Ocr.pre_process()`.
+
+    Examples:
+        class OcrTitle(Ocr):
+            pre_process_steps = PreProcess(ContrastStretch(), CropToInk(), ScaleToHeight())
+    """
+
+    def __init__(self, *steps: Step):
+        self.steps = steps
+
+    def apply(self, image) -> tuple[np.ndarray, tuple]:
+        """
+        Returns:
+            Processed image and the mapping of its coordinates back to `image`.
+        """
+        sx, sy, ox, oy = IDENTITY
+        for step in self.steps:
+            image, (step_sx, step_sy, step_ox, step_oy) = step.apply(image)
+            ox, oy = step_ox * sx + ox, step_oy * sy + oy
+            sx, sy = step_sx * sx, step_sy * sy
+        return np.ascontiguousarray(image), (sx, sy, ox, oy)
+
+    def __call__(self, image) -> np.ndarray:
+        return self.apply(image)[0]
+
+    @staticmethod
+    def map_back(points, mapping) -> np.ndarray:
+        """
+        Args:
+            points: (n, 2) array of (x, y) in processed image.
+            mapping: Mapping from `apply()`.
+
+        Returns:
+            np.ndarray: Points in input image.
+        """
+        sx, sy, ox, oy = mapping
+        return np.asarray(points, dtype=np.float32) * (sx, sy) + (ox, oy)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({", ".join(map(repr, self.steps))})'
@@ -0,0 +1,374 @@
+"""
+Local OCR inference server, so bot processes on one host share a single copy of each OCR model.
+
+Start the server:
+    python -m zafkiel.ocr.server --address /tmp/zafkiel-ocr.sock --threads 4
+    python -m zafkiel.ocr.server --address \\\\.\\pipe\\zafkiel-ocr --threads 4     # Windows
+
+Then in each bot process:
+    Config.OCR_SERVER = '/tmp/zafkiel-ocr.sock'
+
+Requests are pickled, so only clients that know the authkey may connect.
+Without an explicit authkey, the server generates a random one on start and writes it to `authkey_file(address)`,
+readable by the current user only, where clients of the same user read it.
+"""
+import argparse
+import hashlib
+import os
+import queue
+import secrets
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+import psutil
+
+from zafkiel.config import Config
+from zafkiel.exception import ScriptError
+from zafkiel.logger import logger
+
+OCR_SINGLE_LINE = 'ocr_single_line'
+OCR_LINES = 'ocr_lines'
+DETECT_AND_OCR = 'detect_and_ocr'
+
+
+def authkey_file(address: str) -> str:
+    """
+    Returns:
+        Path of the file holding the generated authkey of the server at `address`.
+    """
+    digest = hashlib.sha1(address.encode()).hexdigest()[:12]
+    return os.path.join(os.path.expanduser('~'), '.zafkiel', f'ocr-server-{digest}.key')
+
+
+def create_authkey(address: str) -> bytes:
+    """
+    Generate a random authkey and write it to `authkey_file(address)` with 0600 permissions.
+    """
+    authkey = secrets.token_hex(32).encode()
+    file = authkey_file(address)
+    os.makedirs(os.path.dirname(file), mode=0o700, exist_ok=True)
+    # Replace any existing file, so its permissions are never inherited
+    if os.path.exists(file):
+        os.remove(file)
+    fd = os.open(file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(authkey)
+    return authkey
+
+
+def load_authkey(address: str) -> bytes:
+    """
+    Returns:
+        `Config.OCR_SERVER_AUTHKEY` if set, otherwise the authkey the server at `address` generated.
+
+    Raises:
+        ScriptError: If no authkey is available.
+    """
+    if Config.OCR_SERVER_AUTHKEY is not None:
+        return Config.OCR_SERVER_AUTHKEY
+    file = authkey_file(address)
+    try:
+        with open(file, 'rb') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise ScriptError(f'No authkey of OCR server {address}, start the server as the same user '
+                          f'or set Config.OCR_SERVER_AUTHKEY')
+
+
+class _Request:
+    __slots__ = ('method', 'model', 'images', 'result', 'error', 'done')
+
+    def __init__(self, method: str, model: str, images: list):
+        self.method = method
+        self.model = model
+        self.images = images
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class OcrServer:
+    """
+    Serve `TextSystem` calls of many clients with one copy of each model.
+
+    Recognition requests of the same model arriving within `batch_wait` are run as one `ocr_lines()` call,
+    whose text lines are sorted by aspect ratio and stacked `rec_batch_num` at a time into one inference.
+    Stacked lines are padded to the widest one, so confidences may differ slightly from in-process `TextSystem`,
+    which recognizes every line alone. Set `rec_batch_num = 1` for identical results.
+    """
+
+    def __init__(
+            self,
+            address: str,
+            authkey: bytes = None,
+            threads: int = None,
+            workers: int = 1,
+            batch_size: int = 32,
+            batch_wait: float = 0.005,
+            rec_batch_num: int = 6,
+            request_timeout: float = 60.,
+    ):
+        """
+        Args:
+            address: Unix socket path, or named pipe path like r'\\\\.\\pipe\\zafkiel-ocr' on Windows.
+            authkey: Shared with clients, None to use `Config.OCR_SERVER_AUTHKEY`,
+                or a random one written to `authkey_file(address)` if that is not set either.
+            threads: CPU cores inference may run on, None for no limit.
+            workers: Batches run at the same time.
+            batch_size: Maximum number of text lines in a batch.
+            batch_wait: Seconds to wait for more requests to join a batch.
+            rec_batch_num: Text lines stacked into one recognizer inference.
+            request_timeout: Seconds a client waits for its request before getting an error reply.
+        """
+        self.address = address
+        if authkey is None:
+            authkey = Config.OCR_SERVER_AUTHKEY
+        self.authkey = authkey
+        self.threads = threads
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.rec_batch_num = rec_batch_num
+        self.request_timeout = request_timeout
+        self.queue: queue.Queue = queue.Queue()
+        self.listener = None
+        self.stopped = threading.Event()
+
+    def _apply_thread_budget(self):
+        if not self.threads:
+            return
+        process = psutil.Process()
+        try:
+            cores = process.cpu_affinity()
+            process.cpu_affinity(cores[:self.threads])
+            logger.info(f'OCR server runs on {min(len(cores), self.threads)} cores')
+        except (AttributeError, psutil.Error):
+            logger.warning('CPU affinity is not supported, OCR server runs without thread budget')
+
+    def _collect(self, request: _Request) -> tuple[list[_Request], list[_Request]]:
+        """
+        Returns:
+            Requests to run in a batch with `request`, and requests of other kinds received meanwhile.
+        """
+        batch, deferred = [request], []
+        size = len(request.images)
+        deadline = time.time() + self.batch_wait
+        while size < self.batch_size:
+            try:
+                other = self.queue.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                break
+            if other is None:
+                deferred.append(other)
+                break
+            if other.method == DETECT_AND_OCR or other.model != request.model:
+                deferred.append(other)
+                continue
+            batch.append(other)
+            size += len(other.images)
+        return batch, deferred
+
+    def _run(self, batch: list[_Request]):
+        # Imported here so clients importing this module do not load pponnxcr
+        from zafkiel.ocr.models import OCR_MODEL
+        try:
+            text_system = OCR_MODEL.get_local(batch[0].model)
+            # Models of the server only serve batches, in-process models keep recognizing lines alone
+            text_system.text_recognizer.rec_batch_num = self.rec_batch_num
+            if batch[0].method == DETECT_AND_OCR:
+                batch[0].result = text_system.detect_and_ocr(batch[0].images[0])
+            else:
+                images = [image for request in batch for image in request.images]
+                results = text_system.ocr_lines(images)
+                start = 0
+                for request in batch:
+                    end = start + len(request.images)
+                    request.result = results[start:end]
+                    start = end
+        except Exception as e:
+            logger.exception(e)
+            for request in batch:
+                request.error = f'{type(e).__name__}: {e}'
+        for request in batch:
+            request.done.set()
+
+    def _worker(self):
+        while True:
+            request = self.queue.get()
+            if request is None:
+                self.queue.put(None)
+                return
+            if request.method == DETECT_AND_OCR:
+                self._run([request])
+                continue
+            batch, deferred = self._collect(request)
+            self._run(batch)
+            for other in deferred:
+                self.queue.put(other)
+
+    def _wait(self, request: _Request):
+        """
+        Wait for request to be done, or fail it on timeout or when server stops.
+        """
+        deadline = time.time() + self.request_timeout
+        while not request.done.wait(0.5):
+            if self.stopped.is_set():
+                request.error = 'OCR server stopped'
+                return
+            if time.time() > deadline:
+                request.error = f'OCR request not done in {self.request_timeout}s'
+                return
+
+    def _serve(self, conn):
+        try:
+            while True:
+                method, model, payload = conn.recv()
+                images = payload if method == OCR_LINES else [payload]
+                request = _Request(method, model, images)
+                if self.stopped.is_set():
+                    request.error = 'OCR server stopped'
+                else:
+                    self.queue.put(request)
+                    self._wait(request)
+                if request.error is not None:
+                    conn.send(('error', request.error))
+                elif method == OCR_SINGLE_LINE:
+                    conn.send(('ok', request.result[0]))
+                else:
+                    conn.send(('ok', request.result))
+        except (EOFError, ConnectionError):
+            pass
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        self._apply_thread_budget()
+        for _ in range(self.workers):
+            threading.Thread(target=self._worker, name='ocr-worker', daemon=True).start()
+
+        if self.authkey is None:
+            self.authkey = create_authkey(self.address)
+            logger.info(f'OCR server authkey written to {authkey_file(self.address)}')
+        self.listener = Listener(self.address, authkey=self.authkey)
+        logger.info(f'OCR server listening on {self.address}')
+        try:
+            while True:
+                try:
+                    conn = self.listener.accept()
+                except Exception as e:
+                    # Client failed authentication or disconnected during handshake, keep serving others
+                    logger.warning(f'OCR server rejected a client: {type(e).__name__}: {e}')
+                    continue
+                threading.Thread(target=self._serve, args=(conn,), name='ocr-client', daemon=True).start()
+        finally:
+            # Connected clients get an error reply instead of waiting forever
+            self.stopped.set()
+            self.queue.put(None)
+            self.listener.close()
+
+
+class RemoteTextSystem:
+    """
+    Client of `OcrServer` with the interface of `TextSystem` used by `Ocr`.
+    Each thread holds its own connection.
+    """
+
+    def __init__(self, lang: str, address: str, authkey: bytes = None):
+        """
+        Args:
+            lang: Model name, defined in pponnxcr.utility
+            address: Address of `OcrServer`.
+            authkey: None to use `load_authkey()`.
+        """
+        self.lang = lang
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Read on every connect, so a restarted server with a new key is picked up
+            authkey = load_authkey(self.address) if self.authkey is None else self.authkey
+            try:
+                conn = Client(self.address, authkey=authkey)
+            except (OSError, AuthenticationError) as e:
+                raise ScriptError(f'Cannot connect to OCR server {self.address}: {e}')
+            self._local.conn = conn
+        return conn
+
+    def _call(self, method: str, payload):
+        for retry in range(2):
+            conn = self._connection()
+            try:
+                conn.send((method, self.lang, payload))
+                status, result = conn.recv()
+                break
+            except (EOFError, ConnectionError):
+                # Server restarted, reconnect once
+                self._local.conn = None
+                if retry:
+                    raise ScriptError(f'Lost connection to OCR server {self.address}')
+        if status != 'ok':
+            raise ScriptError(f'OCR server error: {result}')
+        return result
+
+    @staticmethod
+    def _plain(image) -> np.ndarray:
+        # Plain contiguous array, so server does not need to unpickle ndarray subclasses
+        return np.ascontiguousarray(np.asarray(image))
+
+    def ocr_single_line(self, image) -> tuple[str, float]:
+        return self._call(OCR_SINGLE_LINE, self._plain(image))
+
+    def ocr_lines(self, img_list) -> list[tuple[str, float]]:
+        if not len(img_list):
+            return []
+        return self._call(OCR_LINES, [self._plain(image) for image in img_list])
+
+    def detect_and_ocr(self, image):
+        return self._call(DETECT_AND_OCR, self._plain(image))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local OCR inference server shared by bot processes')
+    parser.add_argument('--address', required=True,
+                        help=r'Unix socket path, or named pipe path like \\.\pipe\zafkiel-ocr on Windows')
+    parser.add_argument('--authkey', default=None,
+                        help='Shared with clients, default to a random one written to a file only this user can read')
+    parser.add_argument('--threads', type=int, default=None, help='CPU cores inference may run on')
+    parser.add_argument('--workers', type=int, default=1, help='Batches run at the same time')
+    parser.add_argument('--batch-size', type=int, default=32, help='Maximum number of text lines in a batch')
+    parser.add_argument('--batch-wait', type=float, default=0.005,
+                        help='Seconds to wait for more requests to join a batch')
+    parser.add_argument('--rec-batch-num', type=int, default=6,
+                        help='Text lines stacked into one recognizer inference, 1 for results identical to in-process OCR')
+    parser.add_argument('--request-timeout', type=float, default=60.,
+                        help='Seconds a client waits for its request before getting an error reply')
+    parser.add_argument('--preload', nargs='*', default=[], help='Models to load on start, e.g. zhs en')
+    args = parser.parse_args()
+
+    # Never forward to another server
+    Config.OCR_SERVER = None
+    server = OcrServer(
+        args.address,
+        authkey=args.authkey.encode() if args.authkey is not None else None,
+        threads=args.threads,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        batch_wait=args.batch_wait,
+        rec_batch_num=args.rec_batch_num,
+        request_timeout=args.request_timeout,
+    )
+    if args.preload:
+        from zafkiel.ocr.models import OCR_MODEL
+        for model in args.preload:
+            OCR_MODEL.get_local(model)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+from difflib import SequenceMatcher
+
+import numpy as np
+
+# Normalized edit distance, 1 - levenshtein(a, b) / max(len(a), len(b))
+SIMILAR_LEVENSHTEIN = 'levenshtein'
+# difflib.SequenceMatcher.ratio(), the metric used before edit distance was introduced
+SIMILAR_DIFFLIB = 'difflib'
+
+
+def max_distance(threshold: float, length):
+    """
+    Args:
+        threshold: Minimum normalized Levenshtein similarity.
+        length (int, np.ndarray): Length of the longer string.
+
+    Returns:
+        Maximum edit distance that still reaches `threshold`.
+    """
+    return np.floor((1 - threshold) * np.asarray(length) + 1e-9).astype(int)
+
+
+def levenshtein(a: str, b: str, max_dist: int = None) -> int:
+    """
+    Levenshtein distance computed within a diagonal band of width `max_dist`,
+    giving up as soon as the distance is known to exceed `max_dist`.
+
+    Args:
+        a:
+        b:
+        max_dist: None for no limit.
+
+    Returns:
+        Edit distance, or `max_dist + 1` if it exceeds `max_dist`.
+    """
+    if a == b:
+        return 0
+    la, lb = len(a), len(b)
+    if max_dist is None:
+        max_dist = max(la, lb)
+    out = max_dist + 1
+    if abs(la - lb) > max_dist:
+        return out
+
+    prev = [j if j <= max_dist else out for j in range(lb + 1)]
+    for i in range(1, la + 1):
+        cur = [out] * (lb + 1)
+        cur[0] = i if i <= max_dist else out
+        row_min = cur[0]
+        char = a[i - 1]
+        for j in range(max(1, i - max_dist), min(lb, i + max_dist) + 1):
+            value = prev[j - 1] + (char != b[j - 1])
+            if prev[j] + 1 < value:
+                value = prev[j] + 1
+            if cur[j - 1] + 1 < value:
+                value = cur[j - 1] + 1
+            if value > out:
+                value = out
+            cur[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_dist:
+            return out
+        prev = cur
+    return prev[lb]
+
+
+def levenshtein_many(query: str, candidates: list[str], max_dist=None) -> np.ndarray:
+    """
+    Levenshtein distance from `query` to every candidate, vectorized over candidates.
+
+    Rows of the DP matrix are computed for all candidates at once, insertions are resolved by a cumulative minimum,
+    candidates are dropped as soon as their row minimum exceeds their `max_dist`.
+
+    Args:
+        query:
+        candidates:
+        max_dist (int, np.ndarray): Maximum distance of interest, shared or one per candidate. None for no limit.
+
+    Returns:
+        np.ndarray: Distance per candidate, `max_dist + 1` for candidates exceeding `max_dist`.
+    """
+    n = len(candidates)
+    lengths = np.fromiter((len(c) for c in candidates), dtype=np.int64, count=n)
+    if max_dist is None:
+        max_dist = np.maximum(lengths, len(query))
+    max_dist = np.broadcast_to(np.asarray(max_dist, dtype=np.int64), (n,))
+    result = max_dist + 1
+    if n == 0:
+        return result
+
+    alive = np.flatnonzero(np.abs(lengths - len(query)) <= max_dist)
+    if not len(alive):
+        return result
+    width = int(lengths[alive].max())
+    codes = np.full((len(alive), width), -1, dtype=np.int64)
+    for row, index in enumerate(alive):
+        codes[row, :lengths[index]] = [ord(c) for c in candidates[index]]
+    lengths_alive = lengths[alive]
+    limit = max_dist[alive]
+
+    columns = np.arange(width + 1)
+    valid = columns[None, :] <= lengths_alive[:, None]
+    prev = np.broadcast_to(columns, (len(alive), width + 1)).copy()
+    for i, char in enumerate(query, start=1):
+        cur = np.empty_like(prev)
+        cur[:, 0] = i
+        np.minimum(prev[:, :-1] + (codes != ord(char)), prev[:, 1:] + 1, out=cur[:, 1:])
+        cur = columns + np.minimum.accumulate(cur - columns, axis=1)
+
+        # Row minimum never decreases in later rows
+        keep = np.where(valid, cur, width + len(query) + 1).min(axis=1) <= limit
+        if not keep.all():
+            alive, codes, lengths_alive, limit, valid, cur = \
+                alive[keep], codes[keep], lengths_alive[keep], limit[keep], valid[keep], cur[keep]
+            if not len(alive):
+                return result
+        prev = cur
+
+    distance = prev[np.arange(len(alive)), lengths_alive]
+    result[alive] = np.where(distance <= limit, distance, limit + 1)
+    return result
+
+
+def similarity(a: str, b: str, metric: str = SIMILAR_LEVENSHTEIN) -> float:
+    """
+    Args:
+        a:
+        b:
+        metric: `SIMILAR_LEVENSHTEIN` or `SIMILAR_DIFFLIB`.
+
+    Returns:
+        Similarity in [0, 1].
+    """
+    if metric == SIMILAR_DIFFLIB:
+        return SequenceMatcher(None, a, b).ratio()
+    length = max(len(a), len(b))
+    if length == 0:
+        return 1.
+    return 1 - levenshtein(a, b) / length
+
+
+def similarity_many(query: str, candidates: list[str], threshold: float = 0.,
+                    metric: str = SIMILAR_LEVENSHTEIN) -> np.ndarray:
+    """
+    Similarity from `query` to every candidate.
+
+    Args:
+        query:
+        candidates:
+        threshold: Candidates that cannot reach it are not fully computed and get 0.
+        metric: `SIMILAR_LEVENSHTEIN` or `SIMILAR_DIFFLIB`.
+
+    Returns:
+        np.ndarray: Similarity per candidate in [0, 1].
+    """
+    if metric == SIMILAR_DIFFLIB:
+        return np.array([SequenceMatcher(None, query, c).ratio() for c in candidates], dtype=float)
+
+    lengths = np.maximum(np.fromiter((len(c) for c in candidates), dtype=np.int64, count=len(candidates)),
+                         len(query))
+    limit = max_distance(threshold, lengths)
+    distance = levenshtein_many(query, candidates, max_dist=limit)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.where(lengths > 0, 1 - distance / lengths, 1.)
+    result[distance > limit] = 0.
+    return result
@@ -1,5 +1,3 @@
-import itertools
-
 import numpy as np
 from pponnxcr.predict_system import BoxedResult
 
@@ -30,10 +28,54 @@ def _merge_area(area1, area2):
 
 def _merge_boxed_result(left: BoxedResult, right: BoxedResult) -> BoxedResult:
     left.box = _merge_area(left.box, right.box)
-    left.ocr_text = left.ocr_text + right.ocr_text
+    left.text = left.text + right.text
     return left
 
 
+def _find_root(parent: list[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def group_areas(areas, thres_x=20, thres_y=20) -> list[list[int]]:
+    """
+    Group areas connected by chains of `area_cross_area()`.
+    Sweep along x on areas sorted by upper left x, so each area is only tested against the areas
+    starting within its horizontal reach, and join crossing ones with union-find.
+
+    Args:
+        areas: (n, 4) array-like of (upper_left_x, upper_left_y, bottom_right_x, bottom_right_y).
+        thres_x:
+        thres_y:
+
+    Returns:
+        Groups of indexes into `areas`, indexes are ascending in each group,
+        groups are ordered by their first index.
+    """
+    areas = np.asarray(areas, dtype=float).reshape(-1, 4)
+    n = len(areas)
+    order = np.argsort(areas[:, 0], kind='stable')
+    x1, y1, x2, y2 = areas[order].T
+    reach = np.searchsorted(x1, x2 + thres_x, side='right')
+
+    parent = list(range(n))
+    for i in range(n):
+        # x1[j] >= x1[i] for j > i, so only the right edge of i and vertical distance remain to be checked
+        j = np.arange(i + 1, max(reach[i], i + 1))
+        j = j[(y1[j] <= y2[i] + thres_y) & (y1[i] <= y2[j] + thres_y)]
+        for k in order[j]:
+            a, b = _find_root(parent, order[i]), _find_root(parent, k)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    groups = {}
+    for i in range(n):
+        groups.setdefault(_find_root(parent, i), []).append(i)
+    return list(groups.values())
+
+
 def merge_buttons(buttons: list[BoxedResult], thres_x=20, thres_y=20) -> list[BoxedResult]:
     """
     Args:
@@ -42,23 +84,21 @@ def merge_buttons(buttons: list[BoxedResult], thres_x=20, thres_y=20) -> list[Bo
         thres_y: Merge results with vertical box distance <= `thres_y`
 
     Returns:
-
+        Merged results, in the order of the first result of each group.
+        Texts are joined in the order of `buttons`.
     """
     if thres_x <= 0 and thres_y <= 0:
         return buttons
+    if len(buttons) < 2:
+        return buttons
 
-    dic_button = {button.box: button for button in buttons}
-    set_merged = set()
-    for left, right in itertools.combinations(dic_button.items(), 2):
-        left_box, left = left
-        right_box, right = right
-        if area_cross_area(left.box, right.box, thres_x=thres_x, thres_y=thres_y):
-            left = _merge_boxed_result(left, right)
-            dic_button[left_box] = left
-            dic_button[right_box] = left
-            set_merged.add(right_box)
-
-    return [button for box, button in dic_button.items() if box not in set_merged]
+    merged = []
+    for group in group_areas([button.box for button in buttons], thres_x=thres_x, thres_y=thres_y):
+        button = buttons[group[0]]
+        for i in group[1:]:
+            button = _merge_boxed_result(button, buttons[i])
+        merged.append(button)
+    return merged
 
 
 def area_offset(area, offset):
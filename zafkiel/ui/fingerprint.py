@@ -0,0 +1,85 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+import cv2
+import numpy as np
+
+from zafkiel.exception import ScriptError
+from zafkiel.utils import crop, image_hash
+
+if TYPE_CHECKING:
+    from zafkiel.ui.page import Page
+
+
+class PageFingerprint:
+    """
+    Index pages by average hashes of stable regions of their reference screenshots,
+    so the current page is narrowed down to a few candidates before template verification.
+
+    Examples:
+        fingerprint = PageFingerprint(regions=[(0, 0, 1, 0.1), (0, 0.9, 1, 1)])
+        fingerprint.add_file(page_main, 'references/page_main.png')
+        fingerprint.add_file(page_shop, 'references/page_shop.png')
+        UI.page_fingerprint = fingerprint
+    """
+
+    def __init__(self, regions=((0., 0., 1., 1.),), hash_size: int = 8, max_distance: int = 10):
+        """
+        Args:
+            regions: Regions that stay the same on a page, like title bar or frame,
+                (upper_left_x, upper_left_y, bottom_right_x, bottom_right_y) in fractions of screen size.
+            hash_size: Side length of the downscaled image of each region.
+            max_distance: Maximum hamming distance from a reference to be a candidate.
+        """
+        self.regions = [tuple(region) for region in regions]
+        self.hash_size = hash_size
+        self.max_distance = max_distance
+        # Key: bytes, packed fingerprint. Value: list of pages
+        self.exact: dict[bytes, list] = {}
+        self.pages: list = []
+        self.fingerprints = np.zeros((0, len(self.regions) * hash_size * hash_size), dtype=bool)
+
+    def fingerprint(self, image) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Flat bool array, hashes of all regions.
+        """
+        h, w = image.shape[:2]
+        hashes = [
+            image_hash(crop(image, (x1 * w, y1 * h, x2 * w, y2 * h)), size=self.hash_size)
+            for x1, y1, x2, y2 in self.regions
+        ]
+        return np.concatenate(hashes)
+
+    def add(self, page: Page, image):
+        """
+        Add a reference screenshot of page, a page can have multiple references.
+        """
+        fingerprint = self.fingerprint(image)
+        self.exact.setdefault(np.packbits(fingerprint).tobytes(), []).append(page)
+        self.pages.append(page)
+        self.fingerprints = np.vstack([self.fingerprints, fingerprint])
+
+    def add_file(self, page: Page, file: str):
+        image = cv2.imread(file)
+        if image is None:
+            raise ScriptError(f'Cannot read page reference {file}')
+        self.add(page, image)
+
+    def lookup(self, image) -> list:
+        """
+        Returns:
+            list[Page]: Candidate pages, exact hash matches first, then others by hamming distance.
+        """
+        if not self.pages:
+            return []
+        fingerprint = self.fingerprint(image)
+        candidates = list(self.exact.get(np.packbits(fingerprint).tobytes(), []))
+
+        distance = np.count_nonzero(self.fingerprints != fingerprint, axis=1)
+        for index in np.argsort(distance, kind='stable'):
+            if distance[index] > self.max_distance:
+                break
+            if self.pages[index] not in candidates:
+                candidates.append(self.pages[index])
+        return candidates
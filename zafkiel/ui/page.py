@@ -1,5 +1,9 @@
 from __future__ import annotations
+import heapq
+import json
+import os
 import traceback
+from typing import Optional
 
 from zafkiel.device.template import ImageTemplate as Template
 from zafkiel.ui.switch import Switch
@@ -14,6 +18,142 @@ class Page:
     # Value: Page, page instance
     all_pages = {}
 
+    # Key: Page, destination page
+    # Value: dict of page -> next page on the fastest route to destination
+    # Built for all destinations on first use, reset when the page graph or link weights change
+    routes = {}
+    # Key: tuple of page names (source, destination)
+    # Value: float, link weight that `routes` were built with
+    route_weights = {}
+    # Learned weights only rebuild routes when they drift from `route_weights` by more than this ratio
+    route_weight_tolerance = 0.2
+
+    # Seconds a link costs if it has no learned weight and no weight hint
+    default_link_weight = 1.
+    # Smoothing factor of learned link weights, weight of the newest observation
+    link_weight_alpha = 0.3
+    # Key: tuple of page names (source, destination)
+    # Value: float, seconds from touching the link until destination appears, learned in `UI.ui_goto()`
+    learned_weights = {}
+    # Key: tuple of page names (source, destination)
+    # Value: int, times that destination is detected right after source
+    transition_counts = {}
+
+    @classmethod
+    def invalidate_routes(cls):
+        cls.routes = {}
+        cls.route_weights = {}
+
+    @classmethod
+    def link_weight(cls, page: Page, destination: Page) -> float:
+        """
+        Returns:
+            Expected seconds of going through link, learned weight first, then weight hint, then default.
+        """
+        weight = cls.learned_weights.get((page.name, destination.name))
+        if weight is None:
+            weight = page.link_hints.get(destination)
+        if weight is None:
+            weight = cls.default_link_weight
+        return weight
+
+    @classmethod
+    def record_transition(cls, page: Page, destination: Page, cost: float) -> bool:
+        """
+        Update learned weight of a link with an observed transition.
+
+        Args:
+            page:
+            destination:
+            cost: Seconds from touching the link until destination appears.
+
+        Returns:
+            If the weight drifted from the one routes were built with, and routes are rebuilt.
+        """
+        key = (page.name, destination.name)
+        weight = cls.learned_weights.get(key)
+        if weight is None:
+            weight = cost
+        else:
+            weight = cls.link_weight_alpha * cost + (1 - cls.link_weight_alpha) * weight
+        cls.learned_weights[key] = weight
+        # Rebuild routes only if the link is routed with a noticeably different weight
+        built = cls.route_weights.get(key)
+        if built is not None and abs(weight - built) > cls.route_weight_tolerance * built:
+            cls.invalidate_routes()
+            return True
+        return False
+
+    @classmethod
+    def save_weights(cls, file: str):
+        data = {f'{source}->{destination}': weight for (source, destination), weight in cls.learned_weights.items()}
+        with open(file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    @classmethod
+    def load_weights(cls, file: str):
+        """
+        Load learned weights saved by `save_weights()`, nothing happens if file does not exist.
+        """
+        if not os.path.isfile(file):
+            return
+        with open(file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for key, weight in data.items():
+            source, destination = key.split('->', 1)
+            cls.learned_weights[(source, destination)] = float(weight)
+        cls.invalidate_routes()
+
+    @classmethod
+    def build_routes(cls):
+        """
+        Run Dijkstra from every destination over reversed links weighted by `link_weight()`,
+        and record the next hop of each page.
+        """
+        # Key: Page. Value: list of (page linked to it, weight)
+        sources = {}
+        route_weights = {}
+        for page in cls.all_pages.values():
+            for linked in page.links:
+                weight = cls.link_weight(page, linked)
+                route_weights[(page.name, linked.name)] = weight
+                sources.setdefault(linked, []).append((page, weight))
+
+        routes = {}
+        for destination in cls.all_pages.values():
+            table = {}
+            cost = {destination: 0.}
+            # Counter keeps heap entries comparable and ties in page order
+            queue = [(0., 0, destination)]
+            counter = 1
+            while queue:
+                current_cost, _, page = heapq.heappop(queue)
+                if current_cost > cost[page]:
+                    continue
+                for source, weight in sources.get(page, ()):
+                    new_cost = current_cost + weight
+                    if source not in cost or new_cost < cost[source]:
+                        cost[source] = new_cost
+                        table[source] = page
+                        heapq.heappush(queue, (new_cost, counter, source))
+                        counter += 1
+            routes[destination] = table
+        cls.routes = routes
+        cls.route_weights = route_weights
+
+    @classmethod
+    def next_hop(cls, current: Page, destination: Page) -> Optional[Page]:
+        """
+        Returns:
+            Next page to go from `current` to `destination`, None if unreachable or already there.
+        """
+        if not cls.routes:
+            cls.build_routes()
+        table = cls.routes.get(destination)
+        if table is None:
+            return None
+        return table.get(current)
+
     @classmethod
     def clear_connection(cls):
         for page in cls.all_pages.values():
@@ -21,37 +161,69 @@ class Page:
 
     @classmethod
     def init_connection(cls, destination: Page):
-        """Initialize an A* path finding among pages.
+        """
+        Set `parent` of each page to its next hop towards destination.
 
         Args:
             destination:
         """
-        cls.clear_connection()
-
-        visited = [destination]
-        visited = set(visited)
-        while True:
-            new = visited.copy()
-            for page in visited:
-                for link in cls.iter_pages():
-                    if link in visited:
-                        continue
-                    if page in link.links:
-                        link.parent = page
-                        new.add(link)
-            if len(new) == len(visited):
-                break
-            visited = new
+        for page in cls.all_pages.values():
+            page.parent = cls.next_hop(page, destination)
 
     @classmethod
     def iter_pages(cls, start_page: Page = None):
-        pages = list(cls.all_pages.values())
-        if start_page is not None and start_page in pages:
-            # Move start_page to the front of the list
-            pages.remove(start_page)
-            pages.insert(0, start_page)
-            cls.all_pages = {page.name: page for page in pages}
-        return cls.all_pages.values()
+        if start_page is not None and start_page.name in cls.all_pages:
+            yield start_page
+        for page in cls.all_pages.values():
+            if page != start_page:
+                yield page
+
+    @classmethod
+    def count_transition(cls, page: Page, destination: Page):
+        key = (page.name, destination.name)
+        cls.transition_counts[key] = cls.transition_counts.get(key, 0) + 1
+
+    @classmethod
+    def _rank_next(cls, page: Page, pages) -> list:
+        """
+        Sort pages by how often they follow `page`, stable for pages never seen after it.
+        """
+        return sorted(pages, key=lambda p: -cls.transition_counts.get((page.name, p.name), 0))
+
+    @classmethod
+    def iter_candidates(cls, expected: Page = None, current: Page = None) -> list:
+        """
+        Pages ordered by the likelihood to be on screen.
+
+        Args:
+            expected: Page expected after a touch on a link, checked first.
+            current: Last known page.
+
+        Returns:
+            list[Page]: `expected`, then its neighbours, then pages that usually follow `current`,
+                then `current`, then all other pages.
+        """
+        ranked = []
+        if expected is not None:
+            ranked.append(expected)
+            neighbours = list(expected.links)
+            neighbours += [page for page in cls.all_pages.values() if expected in page.links]
+            ranked += cls._rank_next(expected, neighbours)
+        if current is not None:
+            ranked += cls._rank_next(current, [
+                page for page in cls.all_pages.values()
+                if cls.transition_counts.get((current.name, page.name))
+            ])
+            ranked.append(current)
+        ranked += cls.all_pages.values()
+
+        pages = []
+        seen = set()
+        for page in ranked:
+            if page not in seen and page.name in cls.all_pages:
+                seen.add(page)
+                pages.append(page)
+        return pages
 
     @classmethod
     def iter_check_buttons(cls):
@@ -62,10 +234,13 @@ class Page:
         self.check_button = check_button
         self.switch = switch
         self.links = {}
+        # Key: Page, destination. Value: float, expected seconds of the link given in `link()`
+        self.link_hints = {}
         (filename, line_number, function_name, text) = traceback.extract_stack()[-2]
         self.name = text[:text.find('=')].strip()
         self.parent = None
         Page.all_pages[self.name] = self
+        Page.invalidate_routes()
 
     def __eq__(self, other):
         return self.name == other.name
@@ -78,5 +253,14 @@ class Page:
 
     __repr__ = __str__
 
-    def link(self, button: Template, destination: Page):
+    def link(self, button: Template, destination: Page, weight: float = None):
+        """
+        Args:
+            button: Button to click to go to destination.
+            destination:
+            weight: Expected seconds of this transition, used in routing until a learned weight exists.
+        """
         self.links[destination] = button
+        if weight is not None:
+            self.link_hints[destination] = weight
+        Page.invalidate_routes()
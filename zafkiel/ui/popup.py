@@ -0,0 +1,122 @@
+import time
+from typing import Callable, Optional, Tuple, Type
+
+from zafkiel.device.api import screenshot, touch
+from zafkiel.device.cv import match_templates
+from zafkiel.device.template import ImageTemplate as Template
+from zafkiel.logger import logger
+from zafkiel.ocr.ocr import Ocr
+
+
+class Popup:
+    # Interval a popup backs off from when its `interval` is 0
+    BACKOFF_START = 0.5
+
+    def __init__(
+            self,
+            template: Template,
+            handler: Optional[Callable[[Tuple[int, int]], bool]] = None,
+            priority: int = 0,
+            interval: float = 0.,
+            max_interval: float = None,
+    ):
+        """
+        Args:
+            template: Template to detect the popup.
+            handler: Called with the matched position, returns whether the popup is handled.
+                None to touch the matched position.
+            priority: Popups with higher priority are handled first.
+            interval: Minimum seconds between two checks.
+            max_interval: If larger than `interval`, check interval doubles after each miss until `max_interval`,
+                so popups rarely seen are checked less often. It is reset to `interval` when the popup appears.
+        """
+        self.template = template
+        self.handler = handler
+        self.priority = priority
+        self.interval = interval
+        self.max_interval = max_interval if max_interval is not None else interval
+        self.current_interval = interval
+        self.last_check = 0.
+
+    def __str__(self):
+        return f'Popup({self.template.name})'
+
+    __repr__ = __str__
+
+    def is_due(self, now: float) -> bool:
+        return now - self.last_check >= self.current_interval
+
+    def update(self, now: float, appeared: bool):
+        self.last_check = now
+        if appeared:
+            self.current_interval = self.interval
+        elif self.max_interval > self.interval:
+            backoff = self.current_interval * 2 if self.current_interval > 0 else self.BACKOFF_START
+            self.current_interval = min(max(backoff, self.interval), self.max_interval)
+
+    def handle(self, pos: Tuple[int, int]) -> bool:
+        if self.handler is None:
+            touch(pos, v_name=self.template.name)
+            return True
+        return bool(self.handler(pos))
+
+
+class PopupScheduler:
+    """
+    Check registered popups that are due on one shared screenshot, and handle the one with the highest priority.
+
+    Examples:
+        scheduler = PopupScheduler()
+        scheduler.register(Template(r"POPUP_CLOSE.png", (0.4, -0.3)), priority=10)
+        scheduler.register(Template(r"DAILY_REWARD.png", (0, 0.2)), handler=claim_reward, interval=1, max_interval=10)
+
+        while 1:
+            if scheduler.run():
+                continue
+    """
+
+    def __init__(self):
+        self.popups: list[Popup] = []
+
+    def register(
+            self,
+            template: Template,
+            handler: Optional[Callable[[Tuple[int, int]], bool]] = None,
+            priority: int = 0,
+            interval: float = 0.,
+            max_interval: float = None,
+    ) -> Popup:
+        """
+        Args: Same as `Popup`.
+        """
+        popup = Popup(template, handler=handler, priority=priority, interval=interval, max_interval=max_interval)
+        self.popups.append(popup)
+        # Stable sort keeps registration order among the same priority
+        self.popups.sort(key=lambda p: -p.priority)
+        return popup
+
+    def run(self, screen=None, cls: Type[Ocr] = Ocr) -> bool:
+        """
+        Args:
+            screen: Screenshot, None to take one if any popup is due.
+            cls: "Ocr" class or its subclass
+
+        Returns:
+            If handled any popup.
+        """
+        now = time.time()
+        due = [popup for popup in self.popups if popup.is_due(now)]
+        if not due:
+            return False
+        if screen is None:
+            screen = screenshot()
+
+        positions = match_templates([popup.template for popup in due], screen, cls=cls)
+        for popup, pos in zip(due, positions):
+            popup.update(now, appeared=pos is not None)
+        for popup, pos in zip(due, positions):
+            if pos is not None:
+                logger.info(f'{popup} appeared')
+                if popup.handle(pos):
+                    return True
+        return False
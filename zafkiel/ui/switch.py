@@ -1,5 +1,9 @@
+from typing import Tuple, Type
+
+from zafkiel.device.cv import score_screen
 from zafkiel.device.template import ImageTemplate as Template
 from zafkiel.exception import ScriptError
+from zafkiel.ocr.ocr import Ocr
 
 
 class Switch:
@@ -64,3 +68,21 @@ class Switch:
                 return row
 
         raise ScriptError(f'Switch {self.name} received an invalid state {state}')
+
+    def detect_state(self, screen, cls: Type[Ocr] = Ocr) -> Tuple[str, float]:
+        """
+        Score the check_button of every state on one screenshot.
+
+        Args:
+            screen: Screenshot.
+            cls: "Ocr" class or its subclass
+
+        Returns:
+            Name of the best scoring state and its confidence, or ('unknown', 0.) if no state matched.
+        """
+        best, best_confidence = 'unknown', 0.
+        for data in self.state_list:
+            pos, confidence = score_screen(data['check_button'], screen, cls=cls)
+            if pos is not None and confidence > best_confidence:
+                best, best_confidence = data['state'], confidence
+        return best, best_confidence
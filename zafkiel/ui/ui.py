@@ -1,14 +1,29 @@
-from typing import Union
+import time
+from typing import Callable, Optional, Tuple, Union
 from zafkiel import exists, Template, app_is_running, touch, screenshot
+from zafkiel.config import Config
+from zafkiel.context import current_context
 from zafkiel.logger import logger
 from zafkiel.ocr.ocr import Ocr
+from zafkiel.ui.fingerprint import PageFingerprint
 from zafkiel.ui.page import Page
+from zafkiel.ui.popup import Popup, PopupScheduler
 from zafkiel.decorator import run_once
 from zafkiel.exception import NotRunningError, PageUnknownError, ScriptError
 from zafkiel.timer import Timer
 from zafkiel.ui.switch import Switch
 
 
+class _ContextUiCurrent:
+    """
+    Resolve `ui_current` against the current context on both the class and its instances,
+    so `UI.ui_current['page']` keeps working as it did when it was a class-level dict.
+    """
+
+    def __get__(self, obj, cls) -> dict:
+        return current_context().ui_current
+
+
 class UI:
     """
     Processing interface related functions.
@@ -16,9 +31,16 @@ class UI:
     and https://github.com/LmeSzinc/StarRailCopilot/blob/master/module/ui/switch.py
     """
 
-    # Make ui_current mutable so that it can be shared among subclasses of the UI class.
-    ui_current: dict = {'page': None}
     popup_list: list = []
+    popup_scheduler: PopupScheduler = PopupScheduler()
+    # Config.PAGE_WEIGHT_FILE that has been loaded into Page.learned_weights
+    page_weight_file: Optional[str] = None
+    # If set, only pages found in it are verified by check_button, unless none of them appears
+    page_fingerprint: Optional[PageFingerprint] = None
+
+    # Current page of the device in current context, shared among subclasses of the UI class.
+    # 'expected' is the page that the last touched link leads to.
+    ui_current: dict = _ContextUiCurrent()
 
     def ui_switch_appear(self, switch: Switch) -> bool:
         """
@@ -28,10 +50,8 @@ class UI:
         if self.ui_get_current_page().switch != switch:
             return False
 
-        for data in switch.state_list:
-            if exists(data['check_button']):
-                return True
-        return False
+        state, _ = switch.detect_state(screenshot())
+        return state != 'unknown'
 
     def ui_get_current_state(self, switch: Switch) -> str:
         """
@@ -45,10 +65,10 @@ class UI:
             logger.warning(f"{self.ui_current['page']} does not have {switch}")
             return 'unknown'
 
-        for data in switch.state_list:
-            if exists(data['check_button']):
-                return data['state']
-        return 'unknown'
+        state, confidence = switch.detect_state(screenshot())
+        if state != 'unknown':
+            logger.debug(f'{switch.name} state: {state} ({confidence:.2f})')
+        return state
 
     @staticmethod
     def ui_page_appear(page: Page, timeout: float = 0) -> Union[bool, tuple]:
@@ -85,11 +105,16 @@ class UI:
                 break
 
             # Known pages
-            for page in Page.iter_pages():
+            pages = Page.iter_candidates(expected=self.ui_current.get('expected'), current=self.ui_current['page'])
+            if self.page_fingerprint is not None:
+                candidates = self.page_fingerprint.lookup(screenshot())
+                pages = [page for page in pages if page in candidates] \
+                    + [page for page in pages if page not in candidates]
+            for page in pages:
                 if page.check_button is None:
                     continue
                 if self.ui_page_appear(page=page):
-                    self.ui_current['page'] = page
+                    self._set_current_page(page)
                     return page
 
             # Unknown page but able to handle
@@ -102,6 +127,16 @@ class UI:
         # Unknown page, need manual switching
         raise PageUnknownError
 
+    def _set_current_page(self, page: Page):
+        """
+        Set current page and learn page transition from previous page.
+        """
+        previous = self.ui_current['page']
+        if previous is not None and previous != page:
+            Page.count_transition(previous, page)
+        self.ui_current['page'] = page
+        self.ui_current['expected'] = None
+
     def _set_state(self, switch: Switch, state: Template) -> bool:
         counter = 0
         changed = False
@@ -159,14 +194,28 @@ class UI:
         else:
             logger.debug(f">>> UI GOTO {str(destination).upper()}")
 
-        # Create connection
-        Page.init_connection(destination)
+        if Config.PAGE_WEIGHT_FILE and UI.page_weight_file != Config.PAGE_WEIGHT_FILE:
+            Page.load_weights(Config.PAGE_WEIGHT_FILE)
+            UI.page_weight_file = Config.PAGE_WEIGHT_FILE
 
+        # Link in transition, tuple of (page, next page, time of first touch)
+        pending = None
+        # If any learned weight drifted enough to be worth saving
+        drifted = False
         while True:
 
+            # Wait for the intermediate page the last touched link leads to instead of destination,
+            # so its learned weight does not include waiting for destination
+            expected = self.ui_current.get('expected')
+            hop = pending is not None and expected is not None and expected != destination \
+                and expected.check_button is not None
+            if hop and self.ui_page_appear(expected, timeout=0.5):
+                drifted |= self._record_transition(pending, expected)
+                pending = None
             # Destination page
-            if self.ui_page_appear(destination, timeout=0.5):
-                self.ui_current['page'] = destination
+            elif self.ui_page_appear(destination, timeout=0 if hop else 0.5):
+                drifted |= self._record_transition(pending, destination)
+                self._set_current_page(destination)
                 logger.debug(f'Page arrive: {destination}')
                 if state is not None:
                     self._set_state(destination.switch, state)
@@ -174,14 +223,20 @@ class UI:
 
             # Other pages
             clicked = False
-            for page in Page.iter_pages(start_page=self.ui_current['page']):
-                if page.parent is None or page.check_button is None:
+            for page in Page.iter_candidates(expected=self.ui_current.get('expected'),
+                                             current=self.ui_current['page']):
+                next_page = Page.next_hop(page, destination)
+                if next_page is None or page.check_button is None:
                     continue
                 if exists(page.check_button):
-                    self.ui_current['page'] = page
-                    button = page.links[page.parent]
+                    drifted |= self._record_transition(pending, page)
+                    if pending is None or pending[:2] != (page, next_page):
+                        pending = (page, next_page, time.time())
+                    self._set_current_page(page)
+                    button = page.links[next_page]
                     touch(button)
-                    logger.info(f'Page switch: {page} -> {page.parent}')
+                    self.ui_current['expected'] = next_page
+                    logger.info(f'Page switch: {page} -> {next_page}')
                     clicked = True
                     break
             if clicked:
@@ -191,8 +246,29 @@ class UI:
             if self.ui_additional():
                 continue
 
-        # Reset connection
-        Page.clear_connection()
+        if drifted and Config.PAGE_WEIGHT_FILE:
+            Page.save_weights(Config.PAGE_WEIGHT_FILE)
+
+    @staticmethod
+    def _record_transition(pending: Optional[tuple], arrived: Page) -> bool:
+        """
+        Learn the time cost of pending link if its destination has arrived.
+
+        Args:
+            pending: Tuple of (page, next page, time of first touch), or None.
+            arrived: Page just detected.
+
+        Returns:
+            If the learned weight drifted past `Page.route_weight_tolerance`.
+        """
+        if pending is None:
+            return False
+        page, next_page, start = pending
+        if arrived != next_page:
+            return False
+        cost = time.time() - start
+        logger.debug(f'Page transition {page} -> {next_page} cost {cost:.2f}s')
+        return Page.record_transition(page, next_page, cost)
 
     def ui_ensure(self, destination: Page, state: Template = None) -> bool:
         """
@@ -273,13 +349,39 @@ class UI:
         for popup in popups:
             self.popup_list.append(popup)
 
+    def register_popup(
+            self,
+            template: Template,
+            handler: Optional[Callable[[Tuple[int, int]], bool]] = None,
+            priority: int = 0,
+            interval: float = 0.,
+            max_interval: float = None,
+    ) -> Popup:
+        """
+        Register a popup to be checked in self.ui_additional(), all registered popups are checked on one screenshot.
+
+        Args:
+            template: Template to detect the popup.
+            handler: Called with the matched position, returns whether the popup is handled.
+                None to touch the matched position.
+            priority: Popups with higher priority are handled first.
+            interval: Minimum seconds between two checks.
+            max_interval: If larger than `interval`, check interval doubles after each miss until `max_interval`.
+        """
+        return self.popup_scheduler.register(
+            template, handler=handler, priority=priority, interval=interval, max_interval=max_interval)
+
     def ui_additional(self) -> bool:
         """
         Handle all possible popups during UI switching.
+        Popups from self.register_popup() are checked first, then functions from self.get_popup_list().
 
         Returns:
             If handled any popup.
         """
+        if self.popup_scheduler.run():
+            return True
+
         for popup in self.popup_list:
             if popup():
                 return True
@@ -2,6 +2,8 @@ import cv2
 import numpy as np
 from PIL import Image
 
+from zafkiel.device.frame import to_gray, to_hsv
+
 
 def random_rectangle_point(center, h, w, n=3):
     """
@@ -84,9 +86,9 @@ def is_color_similar(template, screen, threshold=0.9):
     Returns:
         True if the template image and the screenshot have similar colors, False otherwise.
     """
-    # Convert the template image and the screenshot to the HSV color space
-    template_hsv = cv2.cvtColor(template, cv2.COLOR_BGR2HSV)
-    screen_hsv = cv2.cvtColor(screen, cv2.COLOR_BGR2HSV)
+    # Convert the template image and the screenshot to the HSV color space, memoized on frames
+    template_hsv = to_hsv(template)
+    screen_hsv = to_hsv(screen)
 
     # Calculate the color histograms of the template image and the screenshot
     template_hist = cv2.calcHist([template_hsv], [0, 1], None, [180, 256], [0, 180, 0, 256])
@@ -103,6 +105,62 @@ def is_color_similar(template, screen, threshold=0.9):
     return similarity >= threshold
 
 
+def image_hash(image, size=8):
+    """
+    Average hash of an image, pixels of the downscaled grayscale image compared with their mean.
+
+    Args:
+        image: cv2 image.
+        size: Side length of the downscaled image.
+
+    Returns:
+        np.ndarray: Flat bool array of size * size bits.
+    """
+    image = to_gray(image)
+    image = cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA)
+    return (image > image.mean()).ravel()
+
+
+def hash_distance(hash1, hash2):
+    """
+    Returns:
+        int: Hamming distance between two hashes from image_hash().
+    """
+    return int(np.count_nonzero(hash1 != hash2))
+
+
+def downscale_gray(image, width=160):
+    """
+    Downscaled grayscale image for cheap frame comparison.
+
+    Args:
+        image: cv2 image.
+        width: Output width, height keeps aspect ratio.
+
+    Returns:
+        np.ndarray: float32 grayscale image.
+    """
+    image = to_gray(image)
+    h, w = image.shape
+    if w > width:
+        image = cv2.resize(image, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+    return image.astype(np.float32)
+
+
+def frame_diff(image1, image2):
+    """
+    Args:
+        image1: Image from downscale_gray().
+        image2: Image from downscale_gray().
+
+    Returns:
+        float: Mean absolute difference of gray level, 255 if shapes differ.
+    """
+    if image1.shape != image2.shape:
+        return 255.
+    return float(cv2.absdiff(image1, image2).mean())
+
+
 def color_exists(image, color):
     """
     Check if a specific color exists in the image.